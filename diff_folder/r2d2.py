@@ -1,6 +1,9 @@
 import tkinter as tk
 from tkinter import filedialog, ttk, font
 import os
+import bisect
+
+from r2d2_core import RULER_WIDTH, DiffDensity, FolderComparison, MappedFile, binary_job, format_binary, is_binary, iter_hunks
 
 
 class FolderCompareApp:
@@ -83,6 +86,12 @@ class FolderCompareApp:
         self.vscrollbar = tk.Scrollbar(self.bottom_frame, orient="vertical", command=self.sync_scroll)
         self.vscrollbar.pack(side=tk.RIGHT, fill="y")
 
+        # Overview ruler: diff density of the whole file, click to jump
+        self.ruler = tk.Canvas(self.bottom_frame, width=RULER_WIDTH, highlightthickness=0, background="white")
+        self.ruler.pack(side=tk.RIGHT, fill="y")
+        self.ruler.bind("<Configure>", self.draw_ruler)
+        self.ruler.bind("<Button-1>", self.on_click_ruler)
+
         self.left_text.config(yscrollcommand=self.vscrollbar.set)
         self.right_text.config(yscrollcommand=self.vscrollbar.set)
 
@@ -139,6 +148,8 @@ class FolderCompareApp:
         self.right_file = ""
         self.diff_lines = []
         self.current_diff_index = -1
+        self.clicked_line = 0
+        self.density = None
 
     # -------- Font handling --------
     def change_font(self, font_obj, delta):
@@ -237,16 +248,14 @@ class FolderCompareApp:
             return
         if side == "left":
             self.left_folder = folder
-            self.left_list.delete(0, tk.END)
-            for f in os.listdir(folder):
-                if os.path.isfile(os.path.join(folder, f)):
-                    self.left_list.insert(tk.END, f)
         else:
             self.right_folder = folder
-            self.right_list.delete(0, tk.END)
-            for f in os.listdir(folder):
-                if os.path.isfile(os.path.join(folder, f)):
-                    self.right_list.insert(tk.END, f)
+        comparison = FolderComparison(self.left_folder, self.right_folder).pair()
+        file_list = self.left_list if side == "left" else self.right_list
+        file_list.delete(0, tk.END)
+        names = comparison.names(side)
+        if names:
+            file_list.insert(tk.END, *names)
 
     def file_selected(self, event):
         if self.left_list.curselection():
@@ -259,15 +268,18 @@ class FolderCompareApp:
     def update_line_numbers(self, number_widget, total_lines):
         number_widget.config(state="normal")
         number_widget.delete("1.0", tk.END)
-        for i in range(1, total_lines + 1):
-            number_widget.insert(tk.END, f"{i}\n")
+        if total_lines:
+            number_widget.insert(tk.END, "\n".join(map(str, range(1, total_lines + 1))) + "\n")
         number_widget.config(state="disabled")
 
     def compare_files(self):
-        with open(self.left_file, "r", encoding="utf-8", errors="ignore") as f:
-            left_lines = f.readlines()
-        with open(self.right_file, "r", encoding="utf-8", errors="ignore") as f:
-            right_lines = f.readlines()
+        if is_binary(self.left_file) or is_binary(self.right_file):
+            self.compare_binary_files()
+            return
+        # Always line-indexed: the positional rows below need hashes for every
+        # line, which a ChunkedFile from open_pair doesn't keep
+        left_lines = MappedFile(self.left_file)
+        right_lines = MappedFile(self.right_file)
 
         self.left_text.delete("1.0", tk.END)
         self.right_text.delete("1.0", tk.END)
@@ -276,24 +288,57 @@ class FolderCompareApp:
         self.current_diff_index = -1
 
         max_lines = max(len(left_lines), len(right_lines))
-
-        for i in range(max_lines):
-            left_line = left_lines[i].rstrip("\n") if i < len(left_lines) else ""
-            right_line = right_lines[i].rstrip("\n") if i < len(right_lines) else ""
-
-            self.left_text.insert(tk.END, left_line + "\n")
-            self.right_text.insert(tk.END, right_line + "\n")
-
-            if left_line != right_line:
-                self.left_text.tag_add("diff", f"{i+1}.0", f"{i+1}.end")
-                self.right_text.tag_add("diff", f"{i+1}.0", f"{i+1}.end")
-                self.diff_lines.append(i + 1)
+        self.density = DiffDensity(max_lines)
+
+        # Row i on the left is compared with row i on the right ("positional"
+        # engine); each hunk is one run of equal or differing rows, padded with
+        # empty rows on the shorter side, and goes in with a single insert.
+        left_args, right_args = [], []
+        try:
+            opcodes = list(iter_hunks(left_lines, right_lines, "positional"))
+            # Rows are compared without their line break, so a last line
+            # without one still matches the same text with one
+            last = len(left_lines) - 1
+            if (opcodes and opcodes[-1][0] == "replace" and len(right_lines) - 1 == last
+                    and left_lines[last].rstrip("\n") == right_lines[last].rstrip("\n")):
+                tag, i1, i2, j1, j2 = opcodes.pop()
+                if i1 < last:
+                    opcodes.append((tag, i1, last, j1, last))
+                if opcodes and opcodes[-1][0] == "equal":
+                    opcodes[-1] = ("equal", opcodes[-1][1], last + 1, opcodes[-1][3], last + 1)
+                else:
+                    opcodes.append(("equal", last, last + 1, last, last + 1))
+            for tag, i1, i2, j1, j2 in opcodes:
+                rows = max(i2 - i1, j2 - j1)
+                row = max(i1, j1)
+                left_run = "".join(left_lines[i1:i2])
+                right_run = "".join(right_lines[j1:j2])
+                if left_run and not left_run.endswith("\n"):
+                    left_run += "\n"
+                if right_run and not right_run.endswith("\n"):
+                    right_run += "\n"
+                left_run += "\n" * (rows - (i2 - i1))
+                right_run += "\n" * (rows - (j2 - j1))
+                tags = ()
+                if tag != "equal":
+                    self.diff_lines.extend(range(row + 1, row + rows + 1))
+                    self.density.add(row, row + rows)
+                    tags = ("diff",)
+                left_args += [left_run, tags]
+                right_args += [right_run, tags]
+        finally:
+            left_lines.close()
+            right_lines.close()
+        if left_args:
+            self.left_text.insert(tk.END, *left_args)
+            self.right_text.insert(tk.END, *right_args)
 
         self.left_text.tag_config("diff", background="yellow")
         self.right_text.tag_config("diff", background="yellow")
 
         self.update_line_numbers(self.left_line_numbers, max_lines)
         self.update_line_numbers(self.right_line_numbers, max_lines)
+        self.draw_ruler()
 
         left_name = os.path.basename(self.left_file)
         right_name = os.path.basename(self.right_file)
@@ -304,6 +349,59 @@ class FolderCompareApp:
             self.status_left.config(text=f"Comparing: {left_name} <-> {right_name}")
             self.status_right.config(text="Files are identical")
 
+    def compare_binary_files(self):
+        # Byte compare plus a hex dump of both files around the first difference
+        first, blocks, total, left_rows, right_rows = binary_job(self.left_file, self.right_file)
+        self.left_text.delete("1.0", tk.END)
+        self.right_text.delete("1.0", tk.END)
+        self.diff_lines = []
+        self.current_diff_index = -1
+        self.density = DiffDensity(max(len(left_rows), len(right_rows)))
+        left_args, right_args = [], []
+        for i in range(max(len(left_rows), len(right_rows))):
+            left_row = left_rows[i] if i < len(left_rows) else "\n"
+            right_row = right_rows[i] if i < len(right_rows) else "\n"
+            tags = ()
+            if left_row != right_row:
+                self.diff_lines.append(i + 1)
+                self.density.add(i, i + 1)
+                tags = ("diff",)
+            left_args += [left_row, tags]
+            right_args += [right_row, tags]
+        if left_args:
+            self.left_text.insert(tk.END, *left_args)
+            self.right_text.insert(tk.END, *right_args)
+        self.left_text.tag_config("diff", background="yellow")
+        self.right_text.tag_config("diff", background="yellow")
+        self.update_line_numbers(self.left_line_numbers, len(left_args) // 2)
+        self.update_line_numbers(self.right_line_numbers, len(left_args) // 2)
+        self.draw_ruler()
+
+        left_name = os.path.basename(self.left_file)
+        right_name = os.path.basename(self.right_file)
+        self.status_left.config(text=f"Comparing: {left_name} <-> {right_name}")
+        self.status_right.config(text=format_binary(first, blocks, total))
+
+    # -------- Overview ruler --------
+    def draw_ruler(self, event=None):
+        # One rectangle per run of ruler rows with the same shade
+        self.ruler.delete("all")
+        if self.density is None:
+            return
+        width = self.ruler.winfo_width()
+        for top, bottom, color in self.density.bars(max(1, self.ruler.winfo_height())):
+            self.ruler.create_rectangle(0, top, width, bottom, fill=color, outline="")
+
+    def on_click_ruler(self, event):
+        # Jump to the differing line nearest to the clicked spot
+        if self.density is None:
+            return
+        fraction = min(max(event.y / max(1, self.ruler.winfo_height()), 0.0), 1.0)
+        if not self.diff_lines:
+            self.sync_scroll("moveto", fraction)
+            return
+        self.goto_diff(self.density.nearest(self.diff_lines, fraction))
+
     # -------- Diff navigation --------
     def goto_diff(self, index):
         if not self.diff_lines:
@@ -333,13 +431,13 @@ class FolderCompareApp:
     def goto_next_diff(self):
         if not self.diff_lines:
             return
-        if hasattr(self, "clicked_line") and self.clicked_line:
+        if self.clicked_line:
             # find next diff after clicked line
-            for i, l in enumerate(self.diff_lines):
-                if l > self.clicked_line:
-                    self.goto_diff(i)
-                    self.clicked_line = 0
-                    return
+            i = bisect.bisect_right(self.diff_lines, self.clicked_line)
+            if i < len(self.diff_lines):
+                self.goto_diff(i)
+                self.clicked_line = 0
+                return
         # fallback: normal behavior
         if self.current_diff_index < len(self.diff_lines) - 1:
             self.goto_diff(self.current_diff_index + 1)
@@ -347,13 +445,13 @@ class FolderCompareApp:
     def goto_prev_diff(self):
         if not self.diff_lines:
             return
-        if hasattr(self, "clicked_line") and self.clicked_line:
+        if self.clicked_line:
             # find prev diff before clicked line
-            for i in reversed(range(len(self.diff_lines))):
-                if self.diff_lines[i] < self.clicked_line:
-                    self.goto_diff(i)
-                    self.clicked_line = 0
-                    return
+            i = bisect.bisect_left(self.diff_lines, self.clicked_line) - 1
+            if i >= 0:
+                self.goto_diff(i)
+                self.clicked_line = 0
+                return
         # fallback: normal behavior
         if self.current_diff_index > 0:
             self.goto_diff(self.current_diff_index - 1)
@@ -416,8 +514,10 @@ class FolderCompareApp:
         self.right_text.tag_config("clicked_line", background="lightgreen")
 
         # Update status bar
-        if line in self.diff_lines:
-            idx = self.diff_lines.index(line) + 1
+        # diff_lines is sorted, so a binary search finds the line
+        idx = bisect.bisect_left(self.diff_lines, line)
+        if idx < len(self.diff_lines) and self.diff_lines[idx] == line:
+            idx += 1
             self.status_right.config(text=f"Line {line} clicked (Diff {idx}/{len(self.diff_lines)})")
         else:
             self.status_right.config(text=f"Line {line} clicked (No diff)")
@@ -0,0 +1,411 @@
+#!/usr/bin/env python3
+
+# Micro benchmarks for the R2D2 compare stages.
+#   python r2d2_bench.py identity --size-mb 256
+#   xvfb-run python r2d2_bench.py render --lines 10000 100000 1000000
+#   python r2d2_bench.py engines --lines 20000
+#   python r2d2_bench.py intern --lines 1000000
+#   xvfb-run python r2d2_bench.py suite --files 2000 --output run.json
+#   python r2d2_bench.py compare base.json run.json
+
+import argparse
+import difflib
+import json
+import os
+import platform
+import random
+import shutil
+import statistics
+import sys
+import tempfile
+import time
+import tracemalloc
+
+from r2d2_core import IDENTICAL, DIFFERENT, UNCHECKED, diff_files, files_identical, pair_folders
+from r2d2_engines import DEFAULT_ENGINE, ENGINES, get_opcodes
+
+
+def legacy_quick_compare_files(file1, file2):
+    # The SequenceMatcher based identity check load_folder used to run.
+    with open(file1, "r", encoding="utf-8", errors="ignore") as f:
+        file1_lines = f.readlines()
+    with open(file2, "r", encoding="utf-8", errors="ignore") as f:
+        file2_lines = f.readlines()
+    matcher = difflib.SequenceMatcher(None, file1_lines, file2_lines)
+    for tag, i1, i2, j1, j2 in matcher.get_opcodes():
+        if tag != "equal":
+            return False
+    return True
+
+
+def write_text_file(path, size, seed=0):
+    rng = random.Random(seed)
+    words = ["alpha", "beta", "gamma", "delta", "{", "}", "", "value=42", "key: text"]
+    written = 0
+    with open(path, "w", encoding="utf-8") as f:
+        while written < size:
+            line = " ".join(rng.choice(words) for _ in range(8)) + "\n"
+            f.write(line)
+            written += len(line)
+
+
+def timed(func, *args):
+    start = time.perf_counter()
+    result = func(*args)
+    return time.perf_counter() - start, result
+
+
+# -------- Stages --------
+def bench_identity(args):
+    size = args.size_mb * 1024 * 1024
+    tmp = tempfile.mkdtemp(prefix="r2d2_bench_")
+    try:
+        left = os.path.join(tmp, "left.txt")
+        same = os.path.join(tmp, "same.txt")
+        tail = os.path.join(tmp, "tail.txt")
+        write_text_file(left, size)
+        shutil.copyfile(left, same)
+        shutil.copyfile(left, tail)
+        with open(tail, "a", encoding="utf-8") as f:
+            f.write("changed at the end\n")
+
+        gb = 2 * os.path.getsize(left) / float(1024 ** 3)
+        cases = [("identical", same), ("differ at end", tail)]
+        funcs = [("files_identical", files_identical)]
+        if not args.skip_legacy:
+            funcs.append(("SequenceMatcher", legacy_quick_compare_files))
+        for case_name, other in cases:
+            for func_name, func in funcs:
+                elapsed, result = timed(func, left, other)
+                print(f"{case_name:14} {func_name:16} {elapsed:8.3f}s  {elapsed / gb:8.3f}s/GB  -> {result}")
+    finally:
+        shutil.rmtree(tmp)
+
+
+def make_line_pair(count, change_every=50, seed=0):
+    rng = random.Random(seed)
+    left = [f"line {i} value={rng.randint(0, 999)}\n" for i in range(count)]
+    right = list(left)
+    for i in range(0, count, change_every):
+        right[i] = f"changed {i}\n"
+    return left, right
+
+
+def line_pair_opcodes(count, change_every=50):
+    # Opcodes of make_line_pair, known from where it put the changes. A
+    # SequenceMatcher would be quadratic here: with a change every 50 lines
+    # the earliest longest match splits each range lopsidedly.
+    opcodes = []
+    for i in range(0, count, change_every):
+        opcodes.append(("replace", i, i + 1, i, i + 1))
+        end = min(i + change_every, count)
+        if i + 1 < end:
+            opcodes.append(("equal", i + 1, end, i + 1, end))
+    return opcodes
+
+
+def legacy_fill_panes(app, left_lines, right_lines, opcodes):
+    # The per-line insert loop compare_files used before fill_panes.
+    import tkinter as tk
+    for tag, i1, i2, j1, j2 in opcodes:
+        if tag == "equal":
+            for i in range(i1, i2):
+                app.left_text.insert(tk.END, left_lines[i])
+            for j in range(j1, j2):
+                app.right_text.insert(tk.END, right_lines[j])
+        else:
+            if tag in ("replace", "delete"):
+                for i in range(i1, i2):
+                    app.left_text.insert(tk.END, left_lines[i], tag)
+            if tag in ("replace", "insert"):
+                for j in range(j1, j2):
+                    app.right_text.insert(tk.END, right_lines[j], tag)
+    for widget, total in ((app.left_line_numbers, len(left_lines)), (app.right_line_numbers, len(right_lines))):
+        widget.config(state="normal")
+        widget.delete("1.0", tk.END)
+        for i in range(1, total + 1):
+            widget.insert(tk.END, f"{i}\n")
+        widget.config(state="disabled")
+
+
+def bench_render(args):
+    # Needs a display; run under xvfb-run on headless hosts.
+    import tkinter as tk
+    from r2d2_difflib import FolderCompareApp
+
+    try:
+        root = tk.Tk()
+    except tk.TclError as e:
+        sys.exit(f"render needs a display ({e}); run under xvfb-run")
+    root.withdraw()
+    app = FolderCompareApp(root)
+    try:
+        for count in args.lines:
+            left, right = make_line_pair(count)
+            opcodes = line_pair_opcodes(count)
+            funcs = [("fill_panes", app.fill_panes)]
+            if not args.skip_legacy:
+                funcs.append(("per-line loop", lambda *a: legacy_fill_panes(app, *a)))
+            for func_name, func in funcs:
+                for text in (app.left_text, app.right_text):
+                    text.delete("1.0", tk.END)
+                elapsed, _ = timed(func, left, right, opcodes)
+                root.update_idletasks()
+                print(f"{count:>9} lines  {func_name:14} {elapsed:8.3f}s")
+    finally:
+        root.destroy()
+
+
+def make_source_lines(count, rng):
+    # C-like source: lots of blank lines, braces and repeated boilerplate.
+    lines = []
+    while len(lines) < count:
+        name = f"func_{len(lines)}"
+        lines += [f"int {name}(int arg)\n", "{\n"]
+        for _ in range(rng.randint(2, 12)):
+            lines.append(f"    value = value * {rng.randint(1, 9)} + arg;\n")
+            if rng.random() < 0.3:
+                lines.append("\n")
+        lines += ["    return value;\n", "}\n", "\n"]
+    return lines[:count]
+
+
+def make_log_lines(count, rng):
+    return [f"2026-01-01 00:{i // 60 % 60:02}:{i % 60:02} INFO worker={rng.randint(1, 8)} "
+            f"request={rng.randint(0, 10 ** 6)}\n" for i in range(count)]
+
+
+def mutate(lines, edits, rng):
+    lines = list(lines)
+    for _ in range(edits):
+        pos = rng.randrange(len(lines))
+        action = rng.random()
+        if action < 0.4:
+            lines[pos] = "changed " + lines[pos]
+        elif action < 0.7:
+            del lines[pos:pos + rng.randint(1, 5)]
+        else:
+            lines[pos:pos] = [f"inserted {pos} {k}\n" for k in range(rng.randint(1, 5))]
+    return lines
+
+
+def bench_engines(args):
+    rng = random.Random(args.seed)
+    inputs = [
+        ("source", make_source_lines(args.lines, rng)),
+        ("log", make_log_lines(args.lines, rng)),
+    ]
+    for shape, left in inputs:
+        right = mutate(left, args.edits, rng)
+        for name, engine in ENGINES.items():
+            elapsed, opcodes = timed(engine, left, right)
+            changed = sum(max(i2 - i1, j2 - j1) for tag, i1, i2, j1, j2 in opcodes if tag != "equal")
+            hunks = sum(1 for op in opcodes if op[0] != "equal")
+            print(f"{shape:7} {name:10} {elapsed:8.3f}s  hunks={hunks:6}  changed lines={changed}")
+
+
+def bench_intern(args):
+    # Time and peak traced memory of each engine on raw strings vs interned ids.
+    rng = random.Random(args.seed)
+    left = make_log_lines(args.lines, rng)
+    right = mutate(left, args.edits, rng)
+    # Separate string objects per side, as after reading two files
+    right = [line.encode().decode() for line in right]
+    for name in args.engines:
+        for interned in (False, True):
+            elapsed, _ = timed(get_opcodes, left, right, name, interned)
+            tracemalloc.start()
+            get_opcodes(left, right, name, interned)
+            peak = tracemalloc.get_traced_memory()[1]
+            tracemalloc.stop()
+            label = "interned" if interned else "strings"
+            print(f"{name:10} {label:9} {elapsed:8.3f}s  peak {peak / 2 ** 20:8.1f} MB", flush=True)
+
+
+# -------- Suite --------
+def make_repeat_lines(count, rng):
+    # Few distinct lines repeated over and over, the worst case for line matching
+    pool = [f"    repeated pattern {k}\n" for k in range(8)] + ["\n", "}\n"]
+    return [rng.choice(pool) for _ in range(count)]
+
+
+PATTERNS = {
+    "source": make_source_lines,
+    "log": make_log_lines,
+    "repeat": make_repeat_lines,
+}
+
+
+def make_tree(root, args):
+    # Reproducible left/right trees under root: args.files files spread over
+    # args.dirs folders, args.change_ratio of them edited on the right, plus a
+    # few files that exist on one side only.
+    rng = random.Random(args.seed)
+    left_root = os.path.join(root, "left")
+    right_root = os.path.join(root, "right")
+    line_count = max(1, args.file_kb * 1024 // 40)
+    for index in range(args.files):
+        folder = f"dir{index % args.dirs:03}" if args.dirs > 1 else ""
+        name = os.path.join(folder, f"file{index:06}.txt")
+        lines = PATTERNS[args.pattern](rng.randint(line_count // 2, line_count * 3 // 2), rng)
+        changed = rng.random() < args.change_ratio
+        sides = [(left_root, lines), (right_root, mutate(lines, args.edits, rng) if changed else lines)]
+        if index % 50 == 49:
+            sides = [sides[index // 50 % 2]]
+        for side_root, side_lines in sides:
+            path = os.path.join(side_root, name)
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            with open(path, "w", encoding="utf-8") as f:
+                f.writelines(side_lines)
+    return left_root, right_root
+
+
+def run_stage(results, name, repeat, func, *args):
+    times = []
+    for _ in range(repeat):
+        elapsed, value = timed(func, *args)
+        times.append(elapsed)
+    results[name] = {"seconds": times, "min": min(times), "median": statistics.median(times)}
+    print(f"{name:10} min {min(times):8.3f}s  median {statistics.median(times):8.3f}s", flush=True)
+    return value
+
+
+def check_all(left_root, right_root, rows):
+    return [files_identical(os.path.join(left_root, name), os.path.join(right_root, name))
+            for name, status in rows if status == UNCHECKED]
+
+
+def diff_all(left_root, right_root, names, engine):
+    diffs = []
+    for name in names:
+        left, right, opcodes = diff_files(os.path.join(left_root, name), os.path.join(right_root, name), engine)
+        diffs.append((left[:], right[:], opcodes))
+        left.close()
+        right.close()
+    return diffs
+
+
+def render_all(app, diffs):
+    import tkinter as tk
+    for left, right, opcodes in diffs:
+        for text in (app.left_text, app.right_text):
+            text.delete("1.0", tk.END)
+        app.fill_panes(left, right, opcodes)
+        app.root.update_idletasks()
+
+
+def bench_suite(args):
+    tmp = tempfile.mkdtemp(prefix="r2d2_suite_")
+    results = {}
+    try:
+        elapsed, (left_root, right_root) = timed(make_tree, tmp, args)
+        print(f"generated {args.files} files in {elapsed:.1f}s", flush=True)
+
+        rows = run_stage(results, "scan", args.repeat, pair_folders, left_root, right_root, True)
+        results["scan"]["files"] = len(rows)
+        same = run_stage(results, "identity", args.repeat, check_all, left_root, right_root, rows)
+        checked = [row for row in rows if row[1] == UNCHECKED]
+        results["identity"]["files"] = len(checked)
+        for row, identical in zip(checked, same):
+            row[1] = IDENTICAL if identical else DIFFERENT
+        names = [name for name, status in rows if status == DIFFERENT][:args.diff_files]
+        diffs = run_stage(results, "diff", args.repeat, diff_all, left_root, right_root, names, args.engine)
+        results["diff"]["files"] = len(names)
+
+        if args.render and os.environ.get("DISPLAY"):
+            import tkinter as tk
+            from r2d2_difflib import FolderCompareApp
+            root = tk.Tk()
+            root.withdraw()
+            try:
+                app = FolderCompareApp(root)
+                run_stage(results, "render", args.repeat, render_all, app, diffs)
+            finally:
+                root.destroy()
+        elif args.render:
+            print("render     skipped: no DISPLAY (run under xvfb-run)")
+    finally:
+        shutil.rmtree(tmp)
+
+    report = {
+        "params": {key: value for key, value in vars(args).items() if key not in ("func", "output")},
+        "python": sys.version.split()[0],
+        "platform": platform.platform(),
+        "time": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "stages": results,
+    }
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(report, f, indent=1)
+
+
+def bench_compare(args):
+    # Median of each stage in the new run relative to the baseline run
+    with open(args.baseline) as f:
+        baseline = json.load(f)
+    with open(args.run) as f:
+        run = json.load(f)
+    if baseline["params"] != run["params"]:
+        print("warning: the runs used different parameters")
+    for name, stage in run["stages"].items():
+        if name not in baseline["stages"]:
+            print(f"{name:10} {stage['median']:8.3f}s  (not in baseline)")
+            continue
+        old = baseline["stages"][name]["median"]
+        ratio = stage["median"] / old if old else float("inf")
+        print(f"{name:10} {old:8.3f}s -> {stage['median']:8.3f}s  x{ratio:.2f}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="R2D2 benchmarks")
+    sub = parser.add_subparsers(dest="stage", required=True)
+
+    identity = sub.add_parser("identity", help="time per GB of the folder identity check")
+    identity.add_argument("--size-mb", type=int, default=64)
+    identity.add_argument("--skip-legacy", action="store_true", help="do not time the old SequenceMatcher check")
+    identity.set_defaults(func=bench_identity)
+
+    render = sub.add_parser("render", help="time filling the Text panes (needs a display)")
+    render.add_argument("--lines", type=int, nargs="+", default=[10000, 100000, 1000000])
+    render.add_argument("--skip-legacy", action="store_true", help="do not time the old per-line insert loop")
+    render.set_defaults(func=bench_render)
+
+    engines = sub.add_parser("engines", help="compare the diff engines on source- and log-shaped inputs")
+    engines.add_argument("--lines", type=int, default=20000)
+    engines.add_argument("--edits", type=int, default=200)
+    engines.add_argument("--seed", type=int, default=0)
+    engines.set_defaults(func=bench_engines)
+
+    intern = sub.add_parser("intern", help="diff time and memory with and without line interning")
+    intern.add_argument("--lines", type=int, default=1000000)
+    intern.add_argument("--edits", type=int, default=200)
+    intern.add_argument("--seed", type=int, default=0)
+    intern.add_argument("--engines", nargs="+", default=list(ENGINES), choices=list(ENGINES))
+    intern.set_defaults(func=bench_intern)
+
+    suite = sub.add_parser("suite", help="time scan, identity, diff and render on a synthetic tree")
+    suite.add_argument("--files", type=int, default=1000)
+    suite.add_argument("--dirs", type=int, default=20, help="spread the files over this many folders")
+    suite.add_argument("--file-kb", type=int, default=16, help="average file size")
+    suite.add_argument("--change-ratio", type=float, default=0.2, help="share of files edited on the right")
+    suite.add_argument("--edits", type=int, default=5, help="edits per changed file")
+    suite.add_argument("--pattern", default="source", choices=list(PATTERNS))
+    suite.add_argument("--engine", default=DEFAULT_ENGINE, choices=list(ENGINES))
+    suite.add_argument("--diff-files", type=int, default=50, help="diff and render at most this many pairs")
+    suite.add_argument("--repeat", type=int, default=3)
+    suite.add_argument("--seed", type=int, default=0)
+    suite.add_argument("--render", action="store_true", help="also time the Text panes (needs a display)")
+    suite.add_argument("--output", help="write the results as JSON here")
+    suite.set_defaults(func=bench_suite)
+
+    compare = sub.add_parser("compare", help="compare two suite result files")
+    compare.add_argument("baseline")
+    compare.add_argument("run")
+    compare.set_defaults(func=bench_compare)
+
+    args = parser.parse_args()
+    args.func(args)
+
+
+if __name__ == "__main__":
+    main()
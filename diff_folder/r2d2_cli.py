@@ -0,0 +1,103 @@
+#!/usr/bin/env python3
+
+# Headless R2D2: compare folder pairs without a display.
+#   python r2d2_cli.py left1 right1 [left2 right2 ...] [--recursive] [--patch out.diff]
+# One JSON object per line on stdout (or --output), one per file plus a summary
+# per folder pair. Exit status is 0 when everything is identical, 1 otherwise.
+# Either side of a pair may be a .zip/.tar/.tar.gz archive or a git revision
+# written repo@rev (e.g. . and .@HEAD~1) instead of a folder.
+# Must not import tkinter (directly or through r2d2_difflib).
+
+import argparse
+import json
+import os
+import sys
+from concurrent.futures import ProcessPoolExecutor
+
+from r2d2_core import (IDENTICAL, DIFFERENT, UNCHECKED, count_statuses, diff_files, files_identical,
+                       is_binary, is_source_root, pair_folders)
+from r2d2_engines import DEFAULT_ENGINE, ENGINES, unified_diff
+
+CHUNKSIZE = 32
+
+
+def check_pair(task):
+    # Runs in a worker process: identity check, plus the unified diff if asked for.
+    left_file, right_file, engine, want_patch = task
+    try:
+        if files_identical(left_file, right_file):
+            return IDENTICAL, None, None
+        if not want_patch:
+            return DIFFERENT, None, None
+        if is_binary(left_file) or is_binary(right_file):
+            return DIFFERENT, f"Binary files {left_file} and {right_file} differ\n", None
+        left, right, opcodes = diff_files(left_file, right_file, engine)
+        try:
+            patch = "".join(unified_diff(left, right, opcodes, left_file, right_file))
+        finally:
+            left.close()
+            right.close()
+        return DIFFERENT, patch, None
+    except OSError as e:
+        return DIFFERENT, None, str(e)
+
+
+def compare_pair(executor, left_folder, right_folder, args, out, patch_out):
+    rows = pair_folders(left_folder, right_folder, args.recursive)
+    tasks = [(os.path.join(left_folder, name), os.path.join(right_folder, name), args.engine,
+              patch_out is not None)
+             for name, status in rows if status == UNCHECKED]
+    results = executor.map(check_pair, tasks, chunksize=CHUNKSIZE)
+    for row in rows:
+        name, status = row
+        record = {"left": left_folder, "right": right_folder, "name": name}
+        if status == UNCHECKED:
+            status, patch, error = next(results)
+            row[1] = status
+            if error:
+                record["error"] = error
+            if patch:
+                patch_out.write(patch)
+        record["status"] = status
+        out.write(json.dumps(record) + "\n")
+        out.flush()
+    counts = count_statuses(rows)
+    del counts[UNCHECKED]
+    out.write(json.dumps({"left": left_folder, "right": right_folder, "summary": counts}) + "\n")
+    return len(rows) - counts[IDENTICAL]
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="R2D2 folder compare, headless batch mode")
+    parser.add_argument("folders", nargs="+", metavar="LEFT RIGHT",
+                        help="one or more pairs of folders, archives or repo@rev revisions")
+    parser.add_argument("-r", "--recursive", action="store_true", help="compare whole folder trees")
+    parser.add_argument("-o", "--output", help="write JSON Lines here instead of stdout")
+    parser.add_argument("-p", "--patch", help="write unified diffs of differing files to this file")
+    parser.add_argument("-e", "--engine", default=DEFAULT_ENGINE, choices=list(ENGINES))
+    parser.add_argument("-j", "--jobs", type=int, default=None, help="worker processes (default: CPU count)")
+    args = parser.parse_args(argv)
+    if len(args.folders) % 2:
+        parser.error("folders must be given in LEFT RIGHT pairs")
+    for folder in args.folders:
+        if not (os.path.isdir(folder) or is_source_root(folder)):
+            parser.error(f"not a folder, archive or revision: {folder}")
+
+    out = open(args.output, "w") if args.output else sys.stdout
+    patch_out = open(args.patch, "w") if args.patch else None
+    differences = 0
+    try:
+        with ProcessPoolExecutor(max_workers=args.jobs) as executor:
+            pairs = zip(args.folders[0::2], args.folders[1::2])
+            for left_folder, right_folder in pairs:
+                differences += compare_pair(executor, left_folder, right_folder, args, out, patch_out)
+    finally:
+        if out is not sys.stdout:
+            out.close()
+        if patch_out is not None:
+            patch_out.close()
+    return 1 if differences else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,1593 @@
+#!/usr/bin/env python3
+
+# Compare helpers shared by the R2D2 front-ends. Nothing in here may import tkinter.
+
+import bisect
+import hashlib
+import io
+import mmap
+import os
+import subprocess
+import tarfile
+import threading
+import time
+import zipfile
+import zlib
+from array import array
+from collections import OrderedDict, deque
+from itertools import accumulate, islice, repeat, zip_longest
+from operator import add, and_
+from types import SimpleNamespace
+
+from r2d2_engines import DEFAULT_ENGINE, histogram_split, iter_blocks, iter_merged, iter_opcodes
+
+try:
+    import sqlite3
+except ImportError:  # Python built without sqlite: run without the digest cache
+    sqlite3 = None
+
+try:
+    import inotify_simple
+except ImportError:  # optional; watch mode falls back to plain polling
+    inotify_simple = None
+
+CHUNK_SIZE = 1024 * 1024
+CACHE_FILE = os.path.expanduser("~/.r2d2.cache.db")
+CACHE_MAX_ENTRIES = 200000
+CACHE_BATCH = 200  # digest cache rows per write transaction
+CACHE_COMMIT_SECONDS = 1.0  # pending rows are written at least this often
+CACHE_BUSY_SECONDS = 1.0  # how long a write waits on another instance's transaction
+INDEX_CHUNK = 8 * 1024 * 1024
+DIFF_CACHE_MB = 256
+OPCODE_BYTES = 120  # rough size of one opcode tuple with its ints
+SNIFF_SIZE = 8000  # same prefix git looks at for NUL bytes
+BINARY_BLOCK = 4096
+HEX_WIDTH = 16
+HEX_ROWS = 32
+DIGEST_VERSION = 2  # bump when the digest definition changes
+TRACE_MAX_SPANS = 100000
+PREVIEW_BYTES = 256 * 1024  # cap on the head read for a progressive diff
+HUNK_BATCH = 500
+HUNK_BATCH_SECONDS = 0.1
+COMPRESSED_MAGIC = (b"\x1f\x8b", b"BZh", b"\xfd7zXZ\x00")  # gzip, bzip2, xz
+ARCHIVE_SUFFIXES = (".zip", ".tar", ".tar.gz", ".tgz", ".tar.bz2", ".tbz2", ".tar.xz", ".txz")
+CHUNKED_BYTES = 256 * 1024 * 1024  # bigger files are diffed by chunk anchors, without a full line index
+CDC_MAX_CHUNKS = 65536  # chunk size grows with the file so the chunk table stays this small
+CDC_MIN_AVG = 64 * 1024
+GAP_MAX_LINES = 200000  # unmatched gaps bigger than this on either side become one replace hunk
+CHUNK_CACHE = 8  # chunks whose line offsets are kept for reading lines
+CDC_SEED = 0x5BD1E995  # crc32 start value for cut points; keeps empty lines (crc 0) from all being cuts
+DENSITY_BUCKETS = 2048  # resolution of the overview ruler, independent of file length
+RULER_WIDTH = 12
+RULER_COLORS = ("#ffd27f", "#ffa040", "#ff6000", "#d00000")  # by share of differing lines
+
+
+# -------- Timing spans --------
+class Span:
+    def __init__(self, tracer, name, counts):
+        self.tracer = tracer
+        self.name = name
+        self.counts = counts
+
+    def set(self, **counts):
+        self.counts.update(counts)
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        self.tracer.add(self.name, self.start, time.perf_counter(), self.counts)
+
+
+class NullSpan:
+    def set(self, **counts):
+        pass
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        pass
+
+
+NULL_SPAN = NullSpan()
+
+
+class Tracer:
+    # Timed spans around the compare phases, with byte/line counts. Disabled,
+    # span() hands out one shared NullSpan, so instrumented code pays a method
+    # call and nothing else. Spans are (name, start, end, pid, thread, counts)
+    # with perf_counter times, kept in a bounded deque.
+
+    def __init__(self, enabled=False, max_spans=TRACE_MAX_SPANS):
+        self.enabled = enabled
+        self.spans = deque(maxlen=max_spans)
+        self.lock = threading.Lock()
+
+    def span(self, name, **counts):
+        if not self.enabled:
+            return NULL_SPAN
+        return Span(self, name, counts)
+
+    def add(self, name, start, end, counts=None):
+        span = (name, start, end, os.getpid(), threading.get_ident(), counts or {})
+        with self.lock:
+            self.spans.append(span)
+
+    def extend(self, spans):
+        with self.lock:
+            self.spans.extend(spans)
+
+    def clear(self):
+        with self.lock:
+            self.spans.clear()
+
+    def summary(self):
+        # {name: {"count", "total", "max", plus summed counts}} in seconds
+        phases = {}
+        with self.lock:
+            spans = list(self.spans)
+        for name, start, end, pid, thread, counts in spans:
+            phase = phases.setdefault(name, {"count": 0, "total": 0.0, "max": 0.0})
+            phase["count"] += 1
+            phase["total"] += end - start
+            phase["max"] = max(phase["max"], end - start)
+            for key, value in counts.items():
+                phase[key] = phase.get(key, 0) + value
+        return phases
+
+    def to_json(self):
+        with self.lock:
+            spans = list(self.spans)
+        return [{"name": name, "start": start, "seconds": end - start, "pid": pid, "thread": thread,
+                 "counts": counts} for name, start, end, pid, thread, counts in spans]
+
+    def to_chrome(self):
+        # Chrome trace event format ("X" complete events, microseconds); loads
+        # in chrome://tracing and Perfetto
+        with self.lock:
+            spans = list(self.spans)
+        events = [{"name": name, "ph": "X", "ts": start * 1e6, "dur": (end - start) * 1e6, "pid": pid,
+                   "tid": thread, "args": counts} for name, start, end, pid, thread, counts in spans]
+        return {"traceEvents": events, "displayTimeUnit": "ms"}
+
+
+# Shared by everything in this process; worker processes hand their spans
+# back through traced_job.
+TRACER = Tracer()
+
+
+def traced_job(trace, func, *args):
+    # Process pool entry point: run func with the worker's TRACER switched on
+    # or off, return its result and the spans it recorded.
+    TRACER.enabled = trace
+    TRACER.clear()
+    result = func(*args)
+    return result, list(TRACER.spans)
+
+
+# -------- Archives and git revisions --------
+# A zip/tar archive or a git revision can stand in for a folder:
+# "release.tar.gz/bin/tool" names the member bin/tool, "~/src/app@v1.2/bin/tool"
+# the file bin/tool as of tag v1.2 of the repository ~/src/app. Everything below
+# reads files through open_source/source_stat, so members come straight out of
+# the archive or the object store and are never written to disk.
+def is_archive(path):
+    return path.lower().endswith(ARCHIVE_SUFFIXES) and os.path.isfile(path)
+
+
+def is_git_repo(path):
+    return (os.path.exists(os.path.join(path, ".git"))
+            or (os.path.isdir(os.path.join(path, "objects")) and os.path.isfile(os.path.join(path, "HEAD"))))
+
+
+def is_revision(spec):
+    # "repo@rev" for a local repository; rev can't contain "/" or "@" since
+    # member paths are built by appending to the spec
+    repo, sep, rev = spec.rpartition("@")
+    return (bool(sep and repo and rev) and "/" not in rev and os.sep not in rev
+            and not os.path.exists(spec) and is_git_repo(repo))
+
+
+def is_source_root(path):
+    return is_archive(path) or is_revision(path)
+
+
+def run_git(repo, *args):
+    try:
+        return subprocess.run(["git", "-C", repo] + list(args), capture_output=True, check=True).stdout
+    except OSError as e:
+        raise OSError(f"cannot run git: {e}") from e
+    except subprocess.CalledProcessError as e:
+        raise OSError(f"git {args[0]} failed in {repo}: {e.stderr.decode(errors='replace').strip()}") from e
+
+
+class SourceIndex:
+    # Files of a source that isn't a folder on disk: name -> (size, id, info),
+    # plus the folder structure pair_trees walks. id_kind says what the stored
+    # ids are, so files_identical can compare them without reading content;
+    # seekable says whether a member can be read without a pass from the start.
+    id_kind = None
+    seekable = True
+
+    def __init__(self, path):
+        self.path = path
+        self.members = {}
+        self.folders = {"": ([], [])}  # "a/b" -> (file names, folder names)
+
+    def add(self, name, size, content_id, info):
+        # Same rules as scan_entries: hidden files and folders are left out
+        parts = [part for part in name.split("/") if part not in ("", ".")]
+        if not parts or any(part.startswith(".") for part in parts):
+            return
+        folder = ""
+        for part in parts[:-1]:
+            sub = f"{folder}/{part}" if folder else part
+            if sub not in self.folders:
+                self.folders[sub] = ([], [])
+                self.folders[folder][1].append(part)
+            folder = sub
+        name = "/".join(parts)
+        if name not in self.members:
+            self.folders[folder][0].append(parts[-1])
+        self.members[name] = (size, content_id, info)
+
+    def sort(self):
+        for files, folders in self.folders.values():
+            files.sort()
+            folders.sort()
+
+    def listing(self, folder):
+        if folder not in self.folders:
+            raise FileNotFoundError(f"{self.path}: no folder {folder}")
+        files, folders = self.folders[folder]
+        return list(files), list(folders)
+
+    def member(self, name):
+        if name not in self.members:
+            raise FileNotFoundError(f"{self.path}: no member {name}")
+        return self.members[name]
+
+
+class ArchiveIndex(SourceIndex):
+    # Zip sizes and CRCs come from the central directory; tar stores no CRC,
+    # so the one sequential pass that lists a tar (which has to decompress it
+    # anyway) computes them. Each thread reads members through its own handle.
+    # A compressed tar has no random access: reading a member behind the
+    # handle's position decompresses the archive again from the start.
+    id_kind = "crc"
+
+    def __init__(self, path, st):
+        super().__init__(path)
+        self.st = st
+        self.local = threading.local()
+        with TRACER.span("archive index", bytes=st.st_size) as span:
+            try:
+                self.is_zip = zipfile.is_zipfile(path)
+                if self.is_zip:
+                    self.read_zip()
+                else:
+                    with open(path, "rb") as f:
+                        self.seekable = not f.read(6).startswith(COMPRESSED_MAGIC)
+                    self.read_tar()
+            except (zipfile.BadZipFile, tarfile.TarError) as e:
+                raise OSError(f"{path}: {e}") from e
+            span.set(files=len(self.members))
+        self.sort()
+
+    def read_zip(self):
+        with zipfile.ZipFile(self.path) as archive:
+            for info in archive.infolist():
+                if not info.is_dir():
+                    self.add(info.filename, info.file_size, info.CRC, info)
+
+    def read_tar(self):
+        with tarfile.open(self.path, "r:*") as archive:
+            for info in archive:
+                if not info.isfile():
+                    continue
+                crc = 0
+                with archive.extractfile(info) as f:
+                    while True:
+                        chunk = f.read(CHUNK_SIZE)
+                        if not chunk:
+                            break
+                        crc = zlib.crc32(chunk, crc)
+                self.add(info.name, info.size, crc, info)
+
+    def current(self, st):
+        return (st.st_size, st.st_mtime_ns) == (self.st.st_size, self.st.st_mtime_ns)
+
+    def open(self, name):
+        info = self.member(name)[2]
+        handle = getattr(self.local, "handle", None)
+        if handle is None:
+            handle = zipfile.ZipFile(self.path) if self.is_zip else tarfile.open(self.path, "r:*")
+            self.local.handle = handle
+        return handle.open(info) if self.is_zip else handle.extractfile(info)
+
+    def stat(self, name):
+        # Enough of a stat result for the cache keys: the member's size, the
+        # archive's mtime and inode
+        return SimpleNamespace(st_size=self.member(name)[0], st_mtime_ns=self.st.st_mtime_ns,
+                               st_ino=self.st.st_ino)
+
+
+class RevisionIndex(SourceIndex):
+    # One "git ls-tree -r -l" of the revision's tree gives every path with its
+    # blob id and size; no blob is read until open() is called for it.
+    seekable = False  # each open() is a git cat-file of the whole blob
+
+    def __init__(self, spec, tree):
+        super().__init__(spec)
+        self.repo = spec.rpartition("@")[0]
+        self.tree = tree
+        with TRACER.span("revision index") as span:
+            for entry in run_git(self.repo, "ls-tree", "-r", "-l", "-z", tree).split(b"\0"):
+                if not entry:
+                    continue
+                meta, path = entry.split(b"\t", 1)
+                mode, kind, blob, size = meta.split()
+                # Regular files only: symlinks and submodules have no content here
+                if kind == b"blob" and mode != b"120000":
+                    self.add(os.fsdecode(path), int(size), blob.decode(), None)
+            span.set(files=len(self.members))
+        # Object ids are SHA-1 unless the repository uses the SHA-256 format
+        self.id_kind = "blob:sha256" if len(tree) == 64 else "blob:sha1"
+        self.sort()
+
+    def open(self, name):
+        return io.BytesIO(run_git(self.repo, "cat-file", "blob", self.member(name)[1]))
+
+    def stat(self, name):
+        # A blob id pins the content, so it stands in for the mtime in cache keys
+        size, blob, info = self.member(name)
+        return SimpleNamespace(st_size=size, st_mtime_ns=int(blob[:15], 16), st_ino=0)
+
+
+def resolve_tree(spec):
+    repo, sep, rev = spec.rpartition("@")
+    return run_git(repo, "rev-parse", "--verify", rev + "^{tree}").decode().strip()
+
+
+SOURCES = {}
+SOURCES_LOCK = threading.Lock()
+
+
+def source_index(root, refresh=False):
+    # Indexed once per process and reused until the archive changes on disk.
+    # A revision is resolved again only on refresh (a new folder listing), so
+    # e.g. "@HEAD" follows new commits between scans.
+    with SOURCES_LOCK:
+        index = SOURCES.get(root)
+        if is_archive(root):
+            st = os.stat(root)
+            if index is None or not index.current(st):
+                index = SOURCES[root] = ArchiveIndex(root, st)
+        elif index is None or refresh:
+            tree = resolve_tree(root)
+            if index is None or index.tree != tree:
+                index = SOURCES[root] = RevisionIndex(root, tree)
+    return index
+
+
+def source_pins(*paths):
+    # {revision root: tree id} for the revision members among paths, as this
+    # process has them indexed. Sent along with a job so pin_sources in the
+    # worker reads the same trees even after the branch has moved.
+    pins = {}
+    for path in paths:
+        inside = split_source(path)
+        if inside is not None and not is_archive(inside[0]):
+            pins[inside[0]] = source_index(inside[0]).tree
+    return pins
+
+
+def pin_sources(pins):
+    with SOURCES_LOCK:
+        for root, tree in pins.items():
+            index = SOURCES.get(root)
+            if index is None or index.tree != tree:
+                SOURCES[root] = RevisionIndex(root, tree)
+
+
+def split_source(path):
+    # (root, member) for a path inside an archive or revision, None for
+    # anything else. An existing path costs a single stat.
+    if os.path.exists(path):
+        return None
+    parts = []
+    head = path
+    while True:
+        parent, tail = os.path.split(head)
+        if not tail or parent == head:
+            return None
+        parts.append(tail)
+        head = parent
+        if os.path.isfile(head):
+            return (head, "/".join(reversed(parts))) if is_archive(head) else None
+        if os.path.isdir(head):
+            return None
+        if is_revision(head):
+            return head, "/".join(reversed(parts))
+
+
+def open_source(path):
+    # Binary file object for a plain file or a member
+    inside = split_source(path)
+    if inside is None:
+        return open(path, "rb")
+    return source_index(inside[0]).open(inside[1])
+
+
+def source_stat(path):
+    inside = split_source(path)
+    if inside is None:
+        return os.stat(path)
+    return source_index(inside[0]).stat(inside[1])
+
+
+def source_kind(path):
+    # id_kind of the source a member comes from, None for a plain file
+    inside = split_source(path)
+    return None if inside is None else source_index(inside[0]).id_kind
+
+
+def source_seekable(path):
+    inside = split_source(path)
+    return inside is None or source_index(inside[0]).seekable
+
+
+def source_id(path, kind):
+    # Content id of the given kind: stored for members of a matching source,
+    # computed otherwise
+    inside = split_source(path)
+    if inside is not None:
+        index = source_index(inside[0])
+        if index.id_kind == kind:
+            return index.member(inside[1])[1]
+    if kind == "crc":
+        return file_crc(path)
+    return blob_id(path, kind.partition(":")[2])
+
+
+def file_crc(path):
+    crc = 0
+    with open_source(path) as f:
+        while True:
+            chunk = f.read(CHUNK_SIZE)
+            if not chunk:
+                return crc
+            crc = zlib.crc32(chunk, crc)
+
+
+BLOB_IDS = {}  # abspath -> ((size, mtime_ns, inode, algorithm), blob id)
+
+
+def blob_id(path, algorithm="sha1"):
+    # git's object id for a file's content, hash("blob <size>\0" + bytes).
+    # Plain files are cached by stat data, the way git's index does it.
+    key = None
+    if split_source(path) is None:
+        st = os.stat(path)
+        key = (st.st_size, st.st_mtime_ns, st.st_ino, algorithm)
+        cached = BLOB_IDS.get(os.path.abspath(path))
+        if cached is not None and cached[0] == key:
+            return cached[1]
+    digest = hashlib.new(algorithm, b"blob %d\0" % source_stat(path).st_size)
+    with open_source(path) as f:
+        while True:
+            chunk = f.read(CHUNK_SIZE)
+            if not chunk:
+                break
+            digest.update(chunk)
+    value = digest.hexdigest()
+    if key is not None:
+        BLOB_IDS[os.path.abspath(path)] = (key, value)
+    return value
+
+
+# -------- Identity check --------
+def same_bytes(file1, file2, size=None):
+    # Chunked binary compare, stops at the first differing block.
+    if size is None:
+        size = source_stat(file1).st_size
+        if size != source_stat(file2).st_size:
+            return False
+    with open_source(file1) as f1, open_source(file2) as f2:
+        while True:
+            b1 = f1.read(CHUNK_SIZE)
+            b2 = f2.read(CHUNK_SIZE)
+            if b1 != b2:
+                return False
+            if not b1:
+                return True
+
+
+def same_text(file1, file2):
+    # Line-by-line streaming compare with the same decoding the viewer uses,
+    # so CRLF/LF-only or undecodable-byte-only differences still count as identical.
+    with io.TextIOWrapper(open_source(file1), encoding="utf-8", errors="ignore") as f1, \
+         io.TextIOWrapper(open_source(file2), encoding="utf-8", errors="ignore") as f2:
+        for line1, line2 in zip_longest(f1, f2):
+            if line1 != line2:
+                return False
+    return True
+
+
+def text_digest(path):
+    # Digest of the decoded text, so equal digests mean exactly what same_text means.
+    digest = hashlib.blake2b(digest_size=20)
+    with io.TextIOWrapper(open_source(path), encoding="utf-8", errors="ignore") as f:
+        while True:
+            chunk = f.read(CHUNK_SIZE)
+            if not chunk:
+                return digest.digest()
+            digest.update(chunk.encode("utf-8"))
+
+
+def file_digest(path):
+    # Binary files are digested as raw bytes (under their own personalization,
+    # so a binary never matches a text file), text files via text_digest.
+    if not is_binary(path):
+        return text_digest(path)
+    digest = hashlib.blake2b(digest_size=20, person=b"binary")
+    with open_source(path) as f:
+        while True:
+            chunk = f.read(CHUNK_SIZE)
+            if not chunk:
+                return digest.digest()
+            digest.update(chunk)
+
+
+def files_identical(file1, file2, cache=None):
+    # Tiered: equal size + equal bytes is the common fast path, only fall back
+    # to the decoded-text compare when the raw bytes disagree and both files
+    # are text. With a DigestCache the answer comes from stored digests and
+    # unchanged files are never read. Members skip the cache and compare the
+    # ids their source stores (archive CRC-32, git blob id; the other side's is
+    # computed): equal size and id count as equal bytes, so a member is only
+    # read when the text compare needs it. Members of a revision or a
+    # compressed tar are never read here: like git with blob ids, a different
+    # id means a different file (the text compare would read them in name
+    # order, a decompression pass from the start for each tar member).
+    st1 = source_stat(file1)
+    st2 = source_stat(file2)
+    with TRACER.span("identity", bytes=st1.st_size + st2.st_size):
+        kind1 = source_kind(file1)
+        kind2 = source_kind(file2)
+        if kind1 is None and kind2 is None:
+            if cache is not None:
+                return cache.digest(file1, st1) == cache.digest(file2, st2)
+            if st1.st_size == st2.st_size and same_bytes(file1, file2, st1.st_size):
+                return True
+        else:
+            kind = next((kind for kind in (kind1, kind2) if kind and kind.startswith("blob:")), kind1 or kind2)
+            if st1.st_size == st2.st_size and source_id(file1, kind) == source_id(file2, kind):
+                return True
+            if not (source_seekable(file1) and source_seekable(file2)):
+                return False
+        if is_binary(file1) or is_binary(file2):
+            return False
+        return same_text(file1, file2)
+
+
+# -------- Binary files --------
+def is_binary(path):
+    # A NUL byte in the first SNIFF_SIZE bytes, the same test git uses
+    with open_source(path) as f:
+        return b"\0" in f.read(SNIFF_SIZE)
+
+
+def compare_binary(file1, file2):
+    # Chunked byte compare that reads both files to the end. Returns the first
+    # differing offset (None if identical), the number of differing
+    # BINARY_BLOCK blocks and the total block count of the longer file.
+    first = None
+    blocks = 0
+    offset = 0
+    with TRACER.span("binary compare") as span, open_source(file1) as f1, open_source(file2) as f2:
+        span.set(bytes=source_stat(file1).st_size + source_stat(file2).st_size)
+        while True:
+            b1 = f1.read(CHUNK_SIZE)
+            b2 = f2.read(CHUNK_SIZE)
+            if not b1 and not b2:
+                break
+            if b1 != b2:
+                for start in range(0, max(len(b1), len(b2)), BINARY_BLOCK):
+                    x = b1[start:start + BINARY_BLOCK]
+                    y = b2[start:start + BINARY_BLOCK]
+                    if x == y:
+                        continue
+                    blocks += 1
+                    if first is None:
+                        k = 0
+                        while k < len(x) and k < len(y) and x[k] == y[k]:
+                            k += 1
+                        first = offset + start + k
+            offset += max(len(b1), len(b2))
+    return first, blocks, -(-offset // BINARY_BLOCK)
+
+
+def hex_lines(path, offset=0, rows=HEX_ROWS):
+    # Hex dump rows "offset  bytes  ascii" from the row holding offset
+    offset -= offset % HEX_WIDTH
+    with open_source(path) as f:
+        f.seek(offset)
+        data = f.read(rows * HEX_WIDTH)
+    lines = []
+    for pos in range(0, len(data), HEX_WIDTH):
+        row = data[pos:pos + HEX_WIDTH]
+        text = "".join(chr(c) if 32 <= c < 127 else "." for c in row)
+        lines.append(f"{offset + pos:08x}  {row.hex(' '):<{HEX_WIDTH * 3 - 1}}  {text}\n")
+    return lines
+
+
+def binary_job(file1, file2):
+    # Worker side of the binary view: compare summary plus the hex rows of
+    # both files around the first difference.
+    first, blocks, total = compare_binary(file1, file2)
+    start = max(0, first - 4 * HEX_WIDTH) if first is not None else 0
+    return first, blocks, total, hex_lines(file1, start), hex_lines(file2, start)
+
+
+def compare_job(left_file, right_file, engine=DEFAULT_ENGINE, pins=None):
+    # Process pool entry point for a selected pair: ("binary", binary_job) if
+    # either file sniffs as binary, else ("text", diff_job). The sniff reads a
+    # whole blob for a revision member, so it belongs in the worker too.
+    pin_sources(pins or {})
+    if is_binary(left_file) or is_binary(right_file):
+        return "binary", binary_job(left_file, right_file)
+    return "text", diff_job(left_file, right_file, engine)
+
+
+def format_binary(first, blocks, total):
+    if first is None:
+        return "Binary files are identical"
+    return (f"Binary files differ from offset {first:#x}, "
+            f"{blocks}/{total} blocks of {BINARY_BLOCK // 1024} KB differ")
+
+
+# -------- Persistent digest cache --------
+class DigestCache:
+    # File digests keyed by (path, size, mtime_ns, inode) in a small SQLite file.
+    # Shared by the scan worker threads and safe to open from several R2D2
+    # instances at once: WAL journal, short write transactions of at most
+    # CACHE_BATCH rows or CACHE_COMMIT_SECONDS of work, and a short busy
+    # timeout. self.lock only guards the in-memory state; SQLite calls run
+    # under db_lock, so a scan thread never waits on another instance's
+    # write while holding self.lock. Any database error just degrades to a
+    # cache miss; a batch that couldn't be written is retried with the next.
+
+    def __init__(self, path=CACHE_FILE, max_entries=CACHE_MAX_ENTRIES):
+        self.path = path
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+        self.pending = {}  # path -> row not written yet
+        self.touched = {}  # path -> last use not written yet
+        self.flushed = time.monotonic()
+        self.lock = threading.Lock()
+        self.db_lock = threading.Lock()
+        self.db = sqlite3.connect(path, timeout=CACHE_BUSY_SECONDS, check_same_thread=False)
+        self.db.execute("PRAGMA journal_mode=WAL")
+        with self.db:
+            self.db.execute("CREATE TABLE IF NOT EXISTS digests ("
+                            "path TEXT PRIMARY KEY, size INTEGER, mtime_ns INTEGER, inode INTEGER, "
+                            "digest BLOB, used REAL)")
+            self.db.execute("CREATE INDEX IF NOT EXISTS digests_used ON digests (used)")
+            # Digests written by an older definition can't be compared with new ones
+            if self.db.execute("PRAGMA user_version").fetchone()[0] != DIGEST_VERSION:
+                self.db.execute("DELETE FROM digests")
+                self.db.execute(f"PRAGMA user_version={DIGEST_VERSION}")
+
+    @classmethod
+    def open(cls, path=CACHE_FILE, max_entries=CACHE_MAX_ENTRIES):
+        if sqlite3 is None:
+            return None
+        try:
+            return cls(path, max_entries)
+        except sqlite3.Error:
+            return None
+
+    def digest(self, path, st=None):
+        path = os.path.abspath(path)
+        if st is None:
+            st = os.stat(path)
+        key = (st.st_size, st.st_mtime_ns, st.st_ino)
+        with self.lock:
+            row = self.pending.get(path)
+        if row is None:
+            try:
+                with self.db_lock:
+                    row = self.db.execute("SELECT path, size, mtime_ns, inode, digest FROM digests WHERE path=?",
+                                          (path,)).fetchone()
+            except sqlite3.Error:
+                row = None
+        if row is not None and tuple(row[1:4]) == key:
+            with self.lock:
+                self.hits += 1
+                self.touched[path] = time.time()
+            self.flush()
+            return row[4]
+
+        with self.lock:
+            self.misses += 1
+        value = file_digest(path)
+        with self.lock:
+            self.pending[path] = (path,) + key + (value, time.time())
+        self.flush()
+        return value
+
+    def flush(self, force=False):
+        # Write what is pending in one short transaction once there is a batch
+        # of it or CACHE_COMMIT_SECONDS have passed (or always, with force)
+        with self.lock:
+            due = (len(self.pending) + len(self.touched) >= CACHE_BATCH
+                   or time.monotonic() - self.flushed >= CACHE_COMMIT_SECONDS)
+            if not (force or due) or not (self.pending or self.touched):
+                return
+            pending, self.pending = self.pending, {}
+            touched, self.touched = self.touched, {}
+            self.flushed = time.monotonic()
+        try:
+            with self.db_lock, self.db:
+                self.db.executemany("INSERT OR REPLACE INTO digests VALUES (?, ?, ?, ?, ?, ?)", pending.values())
+                self.db.executemany("UPDATE digests SET used=? WHERE path=?",
+                                    [(used, path) for path, used in touched.items()])
+        except sqlite3.Error:
+            # Busy or failed: keep the rows for the next flush, newer ones win
+            with self.lock:
+                self.pending = {**pending, **self.pending}
+                self.touched = {**touched, **self.touched}
+
+    def trim(self):
+        # Write what is pending and evict the least recently used entries
+        # beyond max_entries.
+        self.flush(force=True)
+        try:
+            with self.db_lock, self.db:
+                count = self.db.execute("SELECT COUNT(*) FROM digests").fetchone()[0]
+                if count > self.max_entries:
+                    self.db.execute("DELETE FROM digests WHERE path IN "
+                                    "(SELECT path FROM digests ORDER BY used LIMIT ?)",
+                                    (count - self.max_entries,))
+        except sqlite3.Error:
+            pass
+
+    def close(self):
+        self.trim()
+        with self.db_lock:
+            self.db.close()
+
+    def stats(self):
+        return f"Cache hits: {self.hits}  misses: {self.misses}"
+
+
+# -------- Memory-mapped files --------
+class StaleIndexError(OSError):
+    # A line index built by another process no longer fits the file: it
+    # changed after the worker read it, and so did anything diffed from it.
+    pass
+
+
+class MappedFile:
+    # Read-only line access to a file through mmap. One pass over the mapping
+    # builds the line start offsets and a hash per line (both plain arrays);
+    # text is decoded only for the lines that are actually indexed, so diffing
+    # runs on .hashes and the viewer decodes just what it shows.
+
+    def __init__(self, path, offsets=None):
+        # offsets: an index built elsewhere (e.g. by diff_job in a worker
+        # process); StaleIndexError if it no longer matches the file size.
+        # Such a file has no .hashes and is only good for reading lines.
+        self.path = path
+        self.open_data()
+        self.hashes = array("q")
+        if offsets is not None:
+            self.check_index(offsets[-1])
+            self.offsets = offsets
+        else:
+            self.offsets = array("q", [0])
+            with TRACER.span("read+index", bytes=self.size) as span:
+                self.build_index()
+                span.set(lines=len(self))
+
+    def check_index(self, size):
+        if size != self.size:
+            self.close()
+            raise StaleIndexError(f"{self.path} changed while it was being diffed")
+
+    def open_data(self):
+        if split_source(self.path) is not None:
+            # Members can't be mapped; they are read into memory
+            with open_source(self.path) as f:
+                self.data = f.read()
+            self.size = len(self.data)
+        else:
+            with open(self.path, "rb") as f:
+                self.size = os.fstat(f.fileno()).st_size
+                self.data = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) if self.size else b""
+
+    @property
+    def line_index(self):
+        # What reopen() needs to read lines again without re-indexing
+        return self.offsets
+
+    def build_index(self):
+        data = self.data
+        size = self.size
+        pos = 0
+        while pos < size:
+            # Work in chunks that end on a line break so split() stays in C
+            end = data.rfind(b"\n", pos, pos + INDEX_CHUNK) + 1
+            if end <= pos:
+                end = data.find(b"\n", pos + INDEX_CHUNK) + 1 or size
+            chunk = data[pos:end]
+            lines = chunk.split(b"\n")
+            if chunk.endswith(b"\n"):
+                lines.pop()
+            self.offsets.extend(islice(accumulate(map(add, map(len, lines), repeat(1)), initial=pos), 1, None))
+            if b"\r" in chunk:
+                lines = [line[:-1] if line.endswith(b"\r") else line for line in lines]
+            self.hashes.extend(map(hash, lines))
+            pos = end
+        if size and data[size - 1:size] != b"\n":
+            # A last line without a line break differs from the same text with one
+            self.offsets[-1] = size
+            self.hashes[-1] = hash((self.hashes[-1], "no newline"))
+
+    def __len__(self):
+        return len(self.offsets) - 1
+
+    def line_start(self, index):
+        return self.offsets[index]
+
+    def line_bytes(self, index):
+        return self.data[self.offsets[index]:self.offsets[index + 1]]
+
+    def decode(self, raw):
+        # Same result as reading in text mode: utf-8, errors ignored, CRLF -> LF
+        if raw.endswith(b"\r\n"):
+            raw = raw[:-2] + b"\n"
+        return raw.decode("utf-8", errors="ignore")
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            start, stop, step = index.indices(len(self))
+            return [self.decode(self.line_bytes(i)) for i in range(start, stop, step)]
+        if index < 0:
+            index += len(self)
+        if not 0 <= index < len(self):
+            raise IndexError("line index out of range")
+        return self.decode(self.line_bytes(index))
+
+    def __iter__(self):
+        for index in range(len(self)):
+            yield self.decode(self.line_bytes(index))
+
+    def same_lines(self, other, i1, i2, j1, j2):
+        # Byte compare in CHUNK_SIZE windows, so a long equal run is never
+        # copied out of the mapping whole; line by line if the bytes differ
+        # (CRLF against LF still counts as equal)
+        start, other_start = self.line_start(i1), other.line_start(j1)
+        length = self.line_start(i2) - start
+        if length == other.line_start(j2) - other_start:
+            for offset in range(start, start + length, CHUNK_SIZE):
+                end = min(offset + CHUNK_SIZE, start + length)
+                moved = other_start - start
+                if self.data[offset:end] != other.data[offset + moved:end + moved]:
+                    break
+            else:
+                return True
+        return all(self[i] == other[j] for i, j in zip(range(i1, i2), range(j1, j2)))
+
+    def close(self):
+        if isinstance(self.data, mmap.mmap):
+            self.data.close()
+
+
+# -------- Chunked files --------
+# Files past CHUNKED_BYTES are not indexed line by line. They are cut into
+# content-defined chunks at line breaks: a line whose crc32 has its low bits
+# clear ends a chunk (within min/max chunk sizes), so an insertion moves the
+# cuts only next to it and the other chunks of both files line up again.
+# Chunk digests are diffed first; identical chunks anchor the diff and only
+# the unmatched gaps get a line diff. Memory is bounded by the chunk table
+# (at most ~4 * CDC_MAX_CHUNKS entries), one INDEX_CHUNK block while
+# chunking and GAP_MAX_LINES per gap, whatever the file size.
+def chunk_params(size, sample):
+    # (mask, min bytes, max bytes), shared by both files so their cuts match.
+    # The mask targets the average chunk size in lines of the sampled length.
+    target = max(CDC_MIN_AVG, size // CDC_MAX_CHUNKS)
+    line_length = max(1, len(sample) // max(1, sample.count(b"\n")))
+    lines = max(1, target // line_length)
+    return (1 << (lines.bit_length() - 1)) - 1, target // 4, target * 4
+
+
+def chunk_digest(data):
+    # CRLF is folded like the line hashes, so a CRLF-only change still anchors
+    if b"\r" in data:
+        data = data.replace(b"\r\n", b"\n")
+    return hashlib.blake2b(data, digest_size=16).digest()
+
+
+def chunk_data(data, size, params):
+    # Returns the chunk table (first line of each chunk, byte offset of each
+    # chunk, both ending with a sentinel for the end of the file) and the
+    # chunk digests.
+    mask, min_bytes, max_bytes = params
+    lines_at = array("q", [0])
+    offsets = array("q", [0])
+    digests = []
+    zero = bytes(8)
+
+    def cut(end, line):
+        digests.append(chunk_digest(data[offsets[-1]:end]))
+        lines_at.append(line)
+        offsets.append(end)
+
+    pos = 0
+    first = 0
+    while pos < size:
+        end = data.rfind(b"\n", pos, pos + INDEX_CHUNK) + 1
+        if end <= pos:
+            end = data.find(b"\n", pos + INDEX_CHUNK) + 1 or size
+        block = data[pos:end]
+        lines = block.split(b"\n")
+        if block.endswith(b"\n"):
+            lines.pop()
+        ends = array("q", islice(accumulate(map(add, map(len, lines), repeat(1)), initial=pos), 1, None))
+        ends[-1] = min(ends[-1], size)
+        if b"\r" in block:
+            lines = [line[:-1] if line.endswith(b"\r") else line for line in lines]
+        # Lines whose crc & mask is 0, found by searching the masked crcs for
+        # aligned zero words so the scan stays in C. crc32 rather than hash():
+        # cuts must not depend on the process's hash seed, or the GUI and a
+        # worker would cut the same file differently.
+        masked = array("q", map(and_, map(zlib.crc32, lines, repeat(CDC_SEED)), repeat(mask))).tobytes()
+        candidates = []
+        k = masked.find(zero)
+        while k != -1:
+            if k % 8:
+                k = masked.find(zero, k - k % 8 + 8)
+                continue
+            candidates.append(k // 8)
+            k = masked.find(zero, k + 8)
+        for index in candidates + [None]:
+            limit = ends[index] if index is not None else end
+            # A long stretch without a cut point is cut at max_bytes
+            while limit - offsets[-1] > max_bytes:
+                forced = bisect.bisect_right(ends, offsets[-1] + max_bytes) - 1
+                if forced < 0 or ends[forced] <= offsets[-1]:
+                    forced = bisect.bisect_right(ends, offsets[-1])
+                cut(ends[forced], first + forced + 1)
+            if index is not None and ends[index] - offsets[-1] >= min_bytes:
+                cut(ends[index], first + index + 1)
+        first += len(lines)
+        pos = end
+    if offsets[-1] < size:
+        cut(size, first)
+    return (lines_at, offsets), digests
+
+
+class ChunkedFile(MappedFile):
+    # Line access to a big file through its chunk table instead of a full
+    # offsets array: line offsets are worked out per chunk when a line is read
+    # and kept for the last CHUNK_CACHE chunks.
+
+    def __init__(self, path, chunks=None, params=None):
+        # chunks: a table from an earlier chunking (reopen), StaleIndexError if
+        # it no longer matches the file size; without it the file is chunked
+        # with params. A reopened file has no digests.
+        self.path = path
+        self.open_data()
+        self.digests = []
+        if chunks is not None:
+            self.check_index(chunks[1][-1])
+            self.chunks = chunks
+        else:
+            with TRACER.span("chunk", bytes=self.size) as span:
+                self.chunks, self.digests = chunk_data(self.data, self.size, params)
+                span.set(lines=len(self), chunks=len(self.digests))
+        self.chunk_offsets = OrderedDict()
+        self.lock = threading.Lock()  # the stream thread and the Tk thread both read lines
+
+    @property
+    def line_index(self):
+        return self.chunks
+
+    def __len__(self):
+        return self.chunks[0][-1]
+
+    def line_offsets(self, chunk):
+        with self.lock:
+            return self.cached_offsets(chunk)
+
+    def cached_offsets(self, chunk):
+        offsets = self.chunk_offsets.get(chunk)
+        if offsets is None:
+            start, end = self.chunks[1][chunk], self.chunks[1][chunk + 1]
+            block = self.data[start:end]
+            lines = block.split(b"\n")
+            if block.endswith(b"\n"):
+                lines.pop()
+            offsets = array("q", accumulate(map(add, map(len, lines), repeat(1)), initial=start))
+            offsets[-1] = end
+            self.chunk_offsets[chunk] = offsets
+            if len(self.chunk_offsets) > CHUNK_CACHE:
+                self.chunk_offsets.popitem(last=False)
+        else:
+            self.chunk_offsets.move_to_end(chunk)
+        return offsets
+
+    def line_start(self, index):
+        if index >= len(self):
+            return self.size
+        chunk = bisect.bisect_right(self.chunks[0], index) - 1
+        return self.line_offsets(chunk)[index - self.chunks[0][chunk]]
+
+    def line_bytes(self, index):
+        chunk = bisect.bisect_right(self.chunks[0], index) - 1
+        offsets = self.line_offsets(chunk)
+        local = index - self.chunks[0][chunk]
+        return self.data[offsets[local]:offsets[local + 1]]
+
+    def line_hashes(self, start, end):
+        # Line hashes of [start, end), the same values MappedFile.hashes holds
+        block = self.data[self.line_start(start):self.line_start(end)]
+        lines = block.split(b"\n")
+        if block.endswith(b"\n"):
+            lines.pop()
+        if b"\r" in block:
+            lines = [line[:-1] if line.endswith(b"\r") else line for line in lines]
+        hashes = array("q", map(hash, lines))
+        if end == len(self) and hashes and self.data[self.size - 1:self.size] != b"\n":
+            hashes[-1] = hash((hashes[-1], "no newline"))
+        return hashes
+
+
+def reopen(path, line_index):
+    # MappedFile or ChunkedFile from the line_index of an earlier one;
+    # StaleIndexError if the file has changed since
+    if isinstance(line_index, tuple):
+        return ChunkedFile(path, line_index)
+    return MappedFile(path, line_index)
+
+
+def reopen_pair(left_file, right_file, left_index, right_index):
+    left = reopen(left_file, left_index)
+    try:
+        return left, reopen(right_file, right_index)
+    except OSError:
+        left.close()
+        raise
+
+
+def open_pair(left_file, right_file):
+    # Two MappedFiles, or two ChunkedFiles cut with the same params when either
+    # file is past CHUNKED_BYTES
+    size = max(source_stat(left_file).st_size, source_stat(right_file).st_size)
+    if size <= CHUNKED_BYTES:
+        return MappedFile(left_file), MappedFile(right_file)
+    with open_source(left_file) as f:
+        params = chunk_params(size, f.read(1024 * 1024))
+    return ChunkedFile(left_file, params=params), ChunkedFile(right_file, params=params)
+
+
+def iter_gap(left, right, i1, i2, j1, j2, engine):
+    # Line diff of one unmatched gap between anchors
+    if i1 == i2 and j1 == j2:
+        return
+    if i1 == i2 or j1 == j2:
+        yield ("insert" if i1 == i2 else "delete"), i1, i2, j1, j2
+    elif i2 - i1 > GAP_MAX_LINES or j2 - j1 > GAP_MAX_LINES:
+        yield "replace", i1, i2, j1, j2
+    else:
+        for tag, a1, a2, b1, b2 in iter_opcodes(left.line_hashes(i1, i2), right.line_hashes(j1, j2), engine,
+                                                interned=False):
+            yield tag, a1 + i1, a2 + i1, b1 + j1, b2 + j1
+
+
+def iter_anchored(left, right, engine=DEFAULT_ENGINE):
+    # Unverified opcodes of two ChunkedFiles: chunk digests matched like lines
+    # (histogram splits, so repeated chunks don't derail it), equal chunk runs
+    # as equal line runs, each gap diffed with engine.
+    left_lines, right_lines = left.chunks[0], right.chunks[0]
+    i = j = 0
+    for ci, cj, n in iter_merged(iter_blocks(left.digests, right.digests, histogram_split)):
+        i1, j1 = left_lines[ci], right_lines[cj]
+        yield from iter_gap(left, right, i, i1, j, j1, engine)
+        i, j = left_lines[ci + n], right_lines[cj + n]
+        yield "equal", i1, i, j1, j
+    yield from iter_gap(left, right, i, len(left), j, len(right), engine)
+
+
+def iter_verified(left, right, opcodes):
+    # Line hashes can collide, so every "equal" block is checked against the
+    # mapped bytes (one slice compare per block in the normal case). A block that
+    # fails is split into equal/replace runs line by line. Streams: one opcode
+    # is held back to merge neighbours that end up with the same kind.
+    last = None
+    for op in opcodes:
+        tag, i1, i2, j1, j2 = op
+        if tag != "equal" or left.same_lines(right, i1, i2, j1, j2):
+            pieces = [op]
+        else:
+            pieces = [("equal" if left[i1 + k] == right[j1 + k] else "replace", i1 + k, i1 + k + 1, j1 + k, j1 + k + 1)
+                      for k in range(i2 - i1)]
+        for piece in pieces:
+            if last is None:
+                last = piece
+            elif piece[0] != "equal" and last[0] != "equal":
+                i1, j1 = last[1], last[3]
+                i2, j2 = piece[2], piece[4]
+                tag = "replace" if i1 < i2 and j1 < j2 else ("delete" if i1 < i2 else "insert")
+                last = (tag, i1, i2, j1, j2)
+            elif piece[0] == "equal" and last[0] == "equal":
+                last = ("equal", last[1], piece[2], last[3], piece[4])
+            else:
+                yield last
+                last = piece
+    if last is not None:
+        yield last
+
+
+def head_lines(path, count, limit=PREVIEW_BYTES):
+    # First count lines of a file, decoded like MappedFile, without indexing
+    # the whole file; reads at most limit bytes.
+    lines = []
+    with open_source(path) as f:
+        while len(lines) < count and limit > 0:
+            raw = f.readline(limit)
+            if not raw:
+                break
+            limit -= len(raw)
+            if raw.endswith(b"\r\n"):
+                raw = raw[:-2] + b"\n"
+            lines.append(raw.decode("utf-8", errors="ignore"))
+    return lines
+
+
+def iter_hunks(left, right, engine=DEFAULT_ENGINE):
+    # Verified opcodes of two MappedFiles, yielded as soon as the engine has
+    # settled them (all at the end for difflib). Equal runs are included so a
+    # front-end can render straight from the stream. ChunkedFiles go through
+    # the anchored diff.
+    if isinstance(left, ChunkedFile):
+        return iter_verified(left, right, iter_anchored(left, right, engine))
+    return iter_verified(left, right, iter_opcodes(left.hashes, right.hashes, engine, interned=False))
+
+
+def iter_hunk_batches(left, right, engine=DEFAULT_ENGINE, size=HUNK_BATCH, seconds=HUNK_BATCH_SECONDS):
+    # iter_hunks in lists of up to size opcodes. A batch also goes out once
+    # seconds have passed since the last one, so a slow engine still shows
+    # its first hunks early.
+    batch = []
+    flushed = time.perf_counter()
+    for op in iter_hunks(left, right, engine):
+        batch.append(op)
+        if len(batch) >= size or time.perf_counter() - flushed >= seconds:
+            yield batch
+            batch = []
+            flushed = time.perf_counter()
+    if batch:
+        yield batch
+
+
+def diff_files(left_file, right_file, engine=DEFAULT_ENGINE):
+    # Map both files and diff their line hashes; returns the two MappedFiles and
+    # the verified opcodes. Callers close the MappedFiles when done.
+    left, right = open_pair(left_file, right_file)
+    with TRACER.span("diff", lines=len(left) + len(right)) as span:
+        opcodes = list(iter_hunks(left, right, engine))
+        span.set(opcodes=len(opcodes))
+    return left, right, opcodes
+
+
+def diff_job(left_file, right_file, engine=DEFAULT_ENGINE):
+    # Process pool entry point. Mappings can't be pickled, so this returns the
+    # opcodes and both line indexes; reopen(path, line_index) maps them again.
+    left, right, opcodes = diff_files(left_file, right_file, engine)
+    try:
+        return opcodes, left.line_index, right.line_index
+    finally:
+        left.close()
+        right.close()
+
+
+def stream_job(out, trace, left_file, right_file, engine=DEFAULT_ENGINE, pins=None):
+    # Process entry point of a progressive diff: puts ("files", line indexes),
+    # then ("hunks", batch) messages, then ("done", spans) on the out queue;
+    # ("binary", binary_job result) instead for binary files, or
+    # ("error", message) for any failure. The front-end cancels it by
+    # terminating the process.
+    TRACER.enabled = trace
+    TRACER.clear()
+    try:
+        pin_sources(pins or {})
+        if is_binary(left_file) or is_binary(right_file):
+            out.put(("binary", binary_job(left_file, right_file)))
+            return
+        left, right = open_pair(left_file, right_file)
+        try:
+            out.put(("files", (left.line_index, right.line_index)))
+            for batch in iter_hunk_batches(left, right, engine):
+                out.put(("hunks", batch))
+        finally:
+            left.close()
+            right.close()
+    except Exception as e:
+        out.put(("error", str(e) or type(e).__name__))
+        return
+    out.put(("done", list(TRACER.spans)))
+
+
+# -------- Diff result cache --------
+class DiffCache:
+    # In-memory LRU of diff_job results (opcodes plus both offset indexes). The
+    # key holds both paths, the engine and each file's size and mtime, so an
+    # edited file is simply a miss. Entry sizes are estimated from the array
+    # and opcode counts and the total is kept under the MB budget.
+
+    def __init__(self, max_mb=DIFF_CACHE_MB):
+        self.max_bytes = max_mb * 1024 * 1024
+        self.entries = OrderedDict()
+        self.bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    @staticmethod
+    def key(left_file, right_file, engine):
+        left = source_stat(left_file)
+        right = source_stat(right_file)
+        return (left_file, right_file, engine, left.st_size, left.st_mtime_ns, right.st_size, right.st_mtime_ns)
+
+    def get(self, key):
+        entry = self.entries.get(key)
+        if entry is None:
+            self.misses += 1
+            return None
+        self.entries.move_to_end(key)
+        self.hits += 1
+        return entry[0]
+
+    def put(self, key, result):
+        opcodes, left_index, right_index = result
+        # A line index is an offsets array or a chunk table (a pair of arrays)
+        arrays = [index for index in (left_index, right_index) if not isinstance(index, tuple)]
+        arrays += [table for index in (left_index, right_index) if isinstance(index, tuple) for table in index]
+        size = OPCODE_BYTES * len(opcodes) + sum(table.itemsize * len(table) for table in arrays)
+        if size > self.max_bytes:
+            return
+        old = self.entries.pop(key, None)
+        if old is not None:
+            self.bytes -= old[1]
+        self.entries[key] = (result, size)
+        self.bytes += size
+        while self.bytes > self.max_bytes:
+            _, (_, evicted) = self.entries.popitem(last=False)
+            self.bytes -= evicted
+            self.evictions += 1
+
+    def stats(self):
+        lookups = self.hits + self.misses
+        rate = 100.0 * self.hits / lookups if lookups else 0.0
+        return (f"Diff cache: {self.bytes / 2 ** 20:.1f}/{self.max_bytes / 2 ** 20:.0f} MB  "
+                f"hit rate {rate:.0f}%  evicted {self.evictions}")
+
+
+# -------- Overview ruler --------
+class DiffDensity:
+    # Differing lines per bucket, buckets being equal slices of a file of total
+    # lines. add() touches only the buckets a range covers; rows() resamples the
+    # buckets to a ruler height, so a redraw never walks the file's lines.
+    def __init__(self, total, buckets=DENSITY_BUCKETS):
+        self.total = max(1, total)
+        self.counts = [0] * max(1, min(buckets, self.total))
+        self.prefix = None
+
+    def bound(self, bucket):
+        # First line of a bucket
+        return -(-bucket * self.total // len(self.counts))
+
+    def add(self, start, end):
+        # 0-based [start, end); an empty range (a pure insert on the other
+        # side) still marks the line it sits at
+        start = min(max(start, 0), self.total - 1)
+        end = min(max(end, start + 1), self.total)
+        buckets = len(self.counts)
+        first = start * buckets // self.total
+        last = (end - 1) * buckets // self.total
+        for bucket in range(first, last + 1):
+            self.counts[bucket] += min(end, self.bound(bucket + 1)) - max(start, self.bound(bucket))
+        self.prefix = None
+
+    def rows(self, height):
+        # Fraction of differing lines under each of height ruler rows
+        if self.prefix is None:
+            self.prefix = list(accumulate(self.counts, initial=0))
+        buckets = len(self.counts)
+        fractions = []
+        for row in range(height):
+            first = row * buckets // height
+            last = max(first + 1, (row + 1) * buckets // height)
+            lines = self.bound(last) - self.bound(first)
+            fractions.append((self.prefix[last] - self.prefix[first]) / lines)
+        return fractions
+
+    def bars(self, height):
+        # (top, bottom, color) per run of ruler rows with the same shade
+        bars = []
+        run_start, run_color = 0, None
+        for row, fraction in enumerate(self.rows(height) + [0]):
+            color = RULER_COLORS[min(len(RULER_COLORS) - 1, int(fraction * len(RULER_COLORS)))] if fraction else None
+            if color != run_color:
+                if run_color:
+                    bars.append((run_start, row, run_color))
+                run_start, run_color = row, color
+        return bars
+
+    def nearest(self, starts, fraction):
+        # Index into the sorted 1-based starts of the diff nearest to a
+        # fraction of the way down the file
+        line = int(fraction * self.total) + 1
+        index = bisect.bisect_left(starts, line)
+        if index == len(starts) or (index and line - starts[index - 1] < starts[index] - line):
+            index -= 1
+        return index
+
+
+# -------- Folder pairing --------
+IDENTICAL = "identical"
+DIFFERENT = "different"
+LEFT_ONLY = "left-only"
+RIGHT_ONLY = "right-only"
+UNCHECKED = "unchecked"
+
+STATUS_LABELS = [
+    (IDENTICAL, "Identical"),
+    (DIFFERENT, "Different"),
+    (LEFT_ONLY, "Left only"),
+    (RIGHT_ONLY, "Right only"),
+]
+
+
+def scan_entries(folder):
+    # One os.scandir pass; the DirEntry type info avoids a stat per entry.
+    if not os.path.isdir(folder):
+        inside = (folder, "") if is_source_root(folder) else split_source(folder)
+        if inside is not None:
+            # Listing a root (a new scan) picks up a moved revision
+            return source_index(inside[0], refresh=not inside[1]).listing(inside[1])
+    files, dirs = [], []
+    with os.scandir(folder) as it:
+        for entry in it:
+            if entry.name.startswith('.'):
+                continue
+            if entry.is_dir(follow_symlinks=False):
+                dirs.append(entry.name)
+            elif entry.is_file():
+                files.append(entry.name)
+    files.sort()
+    dirs.sort()
+    return files, dirs
+
+
+def list_files(folder):
+    return scan_entries(folder)[0]
+
+
+def pair_names(left_names, right_names):
+    # Merge-join of two sorted name lists in one linear pass. Each row is
+    # [name, status]; names present on both sides start out UNCHECKED.
+    rows = []
+    i = j = 0
+    while i < len(left_names) and j < len(right_names):
+        left, right = left_names[i], right_names[j]
+        if left == right:
+            rows.append([left, UNCHECKED])
+            i += 1
+            j += 1
+        elif left < right:
+            rows.append([left, LEFT_ONLY])
+            i += 1
+        else:
+            rows.append([right, RIGHT_ONLY])
+            j += 1
+    rows.extend([name, LEFT_ONLY] for name in left_names[i:])
+    rows.extend([name, RIGHT_ONLY] for name in right_names[j:])
+    return rows
+
+
+def pair_trees(left_root, right_root, prefix="", rows=None):
+    # Walk both trees side by side, pairing files by relative path. A folder that
+    # exists on one side only is walked once with an empty other side, so all of
+    # its files come out LEFT_ONLY/RIGHT_ONLY without being scanned twice.
+    if rows is None:
+        rows = []
+    left_files, left_dirs = scan_entries(left_root) if left_root else ([], [])
+    right_files, right_dirs = scan_entries(right_root) if right_root else ([], [])
+    for name, status in pair_names(left_files, right_files):
+        rows.append([prefix + name, status])
+    for name, status in pair_names(left_dirs, right_dirs):
+        left_sub = os.path.join(left_root, name) if status != RIGHT_ONLY else None
+        right_sub = os.path.join(right_root, name) if status != LEFT_ONLY else None
+        pair_trees(left_sub, right_sub, prefix + name + os.sep, rows)
+    return rows
+
+
+def pair_folders(left_folder, right_folder, recursive=False):
+    # Either folder may be empty ("") when only one side has been selected.
+    with TRACER.span("pair folders") as span:
+        if recursive:
+            rows = pair_trees(left_folder or None, right_folder or None)
+        else:
+            left_names = list_files(left_folder) if left_folder else []
+            right_names = list_files(right_folder) if right_folder else []
+            rows = pair_names(left_names, right_names)
+        span.set(files=len(rows))
+    return rows
+
+
+def side_names(rows, side):
+    skip = RIGHT_ONLY if side == "left" else LEFT_ONLY
+    return [row[0] for row in rows if row[1] != skip]
+
+
+def count_statuses(rows):
+    counts = dict.fromkeys([IDENTICAL, DIFFERENT, LEFT_ONLY, RIGHT_ONLY, UNCHECKED], 0)
+    for row in rows:
+        counts[row[1]] += 1
+    return counts
+
+
+def format_counts(counts):
+    return "  ".join(f"{label}: {counts[status]}" for status, label in STATUS_LABELS)
+
+
+class FolderComparison:
+    # The folder-level model behind both GUIs: the paired rows [name, status]
+    # and what can be done with them, no widgets involved. check() only reads
+    # files and returns the status, so it can run on any thread or process;
+    # set_status() is left to whoever owns the rows.
+
+    def __init__(self, left_folder="", right_folder="", recursive=False):
+        self.left_folder = left_folder
+        self.right_folder = right_folder
+        self.recursive = recursive
+        self.rows = []
+
+    def pair(self):
+        self.rows = pair_folders(self.left_folder, self.right_folder, self.recursive)
+        return self
+
+    def paths(self, index):
+        name = self.rows[index][0]
+        return os.path.join(self.left_folder, name), os.path.join(self.right_folder, name)
+
+    def unchecked(self):
+        if not (self.left_folder and self.right_folder):
+            return []
+        return [index for index, row in enumerate(self.rows) if row[1] == UNCHECKED]
+
+    def check(self, index, cache=None):
+        return IDENTICAL if files_identical(*self.paths(index), cache) else DIFFERENT
+
+    def set_status(self, index, status):
+        self.rows[index][1] = status
+
+    def check_all(self, cache=None):
+        for index in self.unchecked():
+            self.set_status(index, self.check(index, cache))
+        return self
+
+    def names(self, side):
+        return side_names(self.rows, side)
+
+    def counts(self):
+        return count_statuses(self.rows)
+
+    def summary(self):
+        return format_counts(self.counts())
+
+
+# -------- Watch mode --------
+def snapshot_folder(folder, recursive=False):
+    # {relative path: (size, mtime_ns)} for the files pair_folders would list,
+    # plus the folders walked (for the inotify watches). An archive is watched
+    # as one file: every member carries the archive's mtime. A revision
+    # doesn't change unless it is re-resolved by a new scan.
+    if is_source_root(folder):
+        index = source_index(folder)
+        names = index.members if recursive else index.listing("")[0]
+        stats = {name.replace("/", os.sep): index.stat(name) for name in names}
+        return {name: (st.st_size, st.st_mtime_ns) for name, st in stats.items()}, [""]
+    files = {}
+    dirs = [""]
+    for prefix in dirs:
+        with os.scandir(os.path.join(folder, prefix)) as it:
+            for entry in it:
+                if entry.name.startswith('.'):
+                    continue
+                if entry.is_dir(follow_symlinks=False):
+                    if recursive:
+                        dirs.append(prefix + entry.name + os.sep)
+                elif entry.is_file():
+                    st = entry.stat()
+                    files[prefix + entry.name] = (st.st_size, st.st_mtime_ns)
+    return files, dirs
+
+
+def changed_names(old, new):
+    # Names added, removed or modified between two snapshots
+    added = new.keys() - old.keys()
+    removed = old.keys() - new.keys()
+    modified = {name for name in new.keys() & old.keys() if new[name] != old[name]}
+    return added, removed, modified
+
+
+class FolderWatcher:
+    # Tells the poller whether a new snapshot is worth taking. With inotify the
+    # answer comes from queued kernel events; without it every poll snapshots.
+
+    def __init__(self):
+        self.inotify = None
+        self.watches = {}  # watch descriptor -> path
+        if inotify_simple is None:
+            return
+        flags = inotify_simple.flags
+        self.mask = (flags.CREATE | flags.DELETE | flags.MODIFY | flags.CLOSE_WRITE | flags.ATTRIB
+                     | flags.MOVED_FROM | flags.MOVED_TO)
+        try:
+            self.inotify = inotify_simple.INotify()
+        except OSError:
+            self.inotify = None
+
+    def watch(self, folder, prefixes):
+        if self.inotify is None:
+            return
+        watched = set(self.watches.values())
+        try:
+            for prefix in prefixes:
+                path = os.path.join(folder, prefix) if prefix else folder
+                if path not in watched and os.path.exists(path):
+                    self.watches[self.inotify.add_watch(path, self.mask)] = path
+        except OSError:
+            # Out of watches or not supported here: fall back to polling
+            self.close()
+
+    def changed(self):
+        if self.inotify is None:
+            return True
+        events = self.inotify.read(timeout=0)
+        for event in events:
+            if event.mask & inotify_simple.flags.IGNORED:
+                # Watched folder went away; a new one at that path gets a new watch
+                self.watches.pop(event.wd, None)
+        return bool(events)
+
+    def close(self):
+        if self.inotify is not None:
+            self.inotify.close()
+            self.inotify = None
+
+
+def snapshot_pair(left_folder, right_folder, recursive=False, watcher=None):
+    # Returns (left files, right files, watcher, seconds taken); the snapshots are
+    # None when the watcher saw no events since the last call.
+    start = time.perf_counter()
+    if watcher is None:
+        watcher = FolderWatcher()
+        watcher.watch(left_folder, [""])
+        watcher.watch(right_folder, [""])
+    elif not watcher.changed():
+        return None, None, watcher, time.perf_counter() - start
+    left_files, left_dirs = snapshot_folder(left_folder, recursive)
+    right_files, right_dirs = snapshot_folder(right_folder, recursive)
+    # Folders created since the last snapshot need watches too
+    watcher.watch(left_folder, left_dirs)
+    watcher.watch(right_folder, right_dirs)
+    return left_files, right_files, watcher, time.perf_counter() - start
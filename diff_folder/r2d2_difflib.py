@@ -1,12 +1,45 @@
 #!/usr/bin/env python3
 
 import tkinter as tk
-from tkinter import filedialog, ttk, font
+from tkinter import filedialog, simpledialog, ttk, font
 import os
-import difflib
+import argparse
+import bisect
+import json
+import multiprocessing
+import time
+
+import queue
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+
+from r2d2_core import (IDENTICAL, DIFFERENT, LEFT_ONLY, RIGHT_ONLY, UNCHECKED, ARCHIVE_SUFFIXES, DIFF_CACHE_MB, TRACER,
+                       RULER_WIDTH, DiffCache, DiffDensity, DigestCache, FolderComparison, MappedFile, StaleIndexError,
+                       changed_names, compare_job, format_binary, head_lines, is_revision, reopen_pair, snapshot_pair,
+                       source_pins, source_stat, split_source, stream_job, traced_job)
+from r2d2_engines import DEFAULT_ENGINE, ENGINES, inline_spans, iter_opcodes
+
+SCAN_POLL_MS = 50
+SCAN_BATCH = 500
+DIFF_POLL_MS = 20
+DIFF_WORKERS = 2  # a stale diff still running doesn't hold up the latest one
+STALE_RETRIES = 2  # re-diffs of a pair whose file changed under the worker
+WATCH_INTERVAL_MS = 2000
+WATCH_COST_FACTOR = 20  # poll interval is at least 20x the last snapshot time
+VIRTUAL_THRESHOLD = 20000  # lines; bigger files use the virtualized view
+VIRTUAL_MARGIN = 20
+VIRTUAL_CONTEXT = 3
+PROGRESSIVE_BYTES = 16 * 1024 * 1024  # bigger files are shown while they are diffed
+APPEND_BATCH = 500  # streamed opcodes added per idle callback
+# Diff workers are started by a server process, not forked from this one: a
+# fork while scan threads hold SOURCES_LOCK, TRACER.lock or the digest cache
+# lock could hand the child a lock that nobody will release.
+MP_CONTEXT = multiprocessing.get_context(
+    "forkserver" if "forkserver" in multiprocessing.get_all_start_methods() else "spawn")
 
 class FolderCompareApp:
-    def __init__(self, root):
+    def __init__(self, root, diff_cache_mb=DIFF_CACHE_MB):
         self.root = root
         self.root.title("R2D2: A Folder Compare Tool")
 
@@ -34,6 +67,14 @@ class FolderCompareApp:
         self.right_topinfo = tk.StringVar(value=">>")
         self.right_label = ttk.Label(self.info_frame, textvariable=self.right_topinfo, font=self.ui_font)
         self.right_label.pack(side="right", anchor="e")
+        self.recursive = tk.BooleanVar(value=False)
+        self.recursive_check = ttk.Checkbutton(self.info_frame, text="Recursive", variable=self.recursive,
+                                               command=self.toggle_recursive)
+        self.recursive_check.pack(anchor="center")
+        self.watch = tk.BooleanVar(value=False)
+        self.watch_check = ttk.Checkbutton(self.info_frame, text="Watch", variable=self.watch,
+                                           command=self.toggle_watch)
+        self.watch_check.pack(anchor="center")
 
         self.left_frame = ttk.Frame(self.top_frame, padding=5)
         self.right_frame = ttk.Frame(self.top_frame, padding=5)
@@ -41,21 +82,50 @@ class FolderCompareApp:
         self.right_frame.pack(side=tk.LEFT, fill=tk.BOTH, expand=True)
 
         # Left side
-        self.left_btn = ttk.Button(self.left_frame, text="Select Folder", command=lambda: self.load_folder("left"))
-        self.left_btn.pack(anchor="w", pady=2)
+        self.left_btn_frame = ttk.Frame(self.left_frame)
+        self.left_btn_frame.pack(anchor="w", pady=2)
+        self.left_btn = ttk.Button(self.left_btn_frame, text="Select Folder", command=lambda: self.load_folder("left"))
+        self.left_btn.pack(side=tk.LEFT)
+        self.left_archive_btn = ttk.Button(self.left_btn_frame, text="Select Archive",
+                                           command=lambda: self.load_folder("left", "archive"))
+        self.left_archive_btn.pack(side=tk.LEFT, padx=5)
+        self.left_revision_btn = ttk.Button(self.left_btn_frame, text="Select Revision",
+                                            command=lambda: self.load_folder("left", "revision"))
+        self.left_revision_btn.pack(side=tk.LEFT)
         self.left_list = tk.Listbox(self.left_frame, font=self.text_font, selectmode="browse",
                                     selectbackground="lightblue", exportselection=False)
         self.left_list.pack(fill=tk.BOTH, expand=True)
         self.left_list.bind("<<ListboxSelect>>", self.file_selected)
 
         # Right side
-        self.right_btn = ttk.Button(self.right_frame, text="Select Folder", command=lambda: self.load_folder("right"))
-        self.right_btn.pack(anchor="e", pady=2)
+        self.right_btn_frame = ttk.Frame(self.right_frame)
+        self.right_btn_frame.pack(anchor="e", pady=2)
+        self.right_btn = ttk.Button(self.right_btn_frame, text="Select Folder", command=lambda: self.load_folder("right"))
+        self.right_btn.pack(side=tk.RIGHT)
+        self.right_archive_btn = ttk.Button(self.right_btn_frame, text="Select Archive",
+                                            command=lambda: self.load_folder("right", "archive"))
+        self.right_archive_btn.pack(side=tk.RIGHT, padx=5)
+        self.right_revision_btn = ttk.Button(self.right_btn_frame, text="Select Revision",
+                                             command=lambda: self.load_folder("right", "revision"))
+        self.right_revision_btn.pack(side=tk.RIGHT)
         self.right_list = tk.Listbox(self.right_frame, font=self.text_font, selectmode="browse",
                                      selectbackground="lightblue", exportselection=False)
         self.right_list.pack(fill=tk.BOTH, expand=True)
         self.right_list.bind("<<ListboxSelect>>", self.file_selected)
 
+        # Recursive mode: one collapsible tree instead of the two lists
+        self.tree_frame = ttk.Frame(self.top_frame, padding=5)
+        self.tree = ttk.Treeview(self.tree_frame, columns=("status",), selectmode="browse")
+        self.tree.heading("#0", text="Path", anchor="w")
+        self.tree.heading("status", text="Status", anchor="w")
+        self.tree.column("status", width=100, stretch=False)
+        self.tree.tag_configure(IDENTICAL, background="lightgreen")
+        self.tree_scrollbar = ttk.Scrollbar(self.tree_frame, orient="vertical", command=self.tree.yview)
+        self.tree.config(yscrollcommand=self.tree_scrollbar.set)
+        self.tree_scrollbar.pack(side=tk.RIGHT, fill="y")
+        self.tree.pack(fill=tk.BOTH, expand=True)
+        self.tree.bind("<<TreeviewSelect>>", self.tree_selected)
+
         # Bottom frame: file contents comparison
         self.bottom_frame = ttk.Frame(self.paned)
         self.paned.add(self.bottom_frame, weight=2)
@@ -72,7 +142,9 @@ class FolderCompareApp:
                                          border=0, background="#f0f0f0", state="disabled",
                                          font=self.text_font)
         self.left_line_numbers.pack(side=tk.LEFT, fill=tk.Y)
-        self.left_text = tk.Text(self.left_text_frame, wrap="none", undo=True, font=self.text_font,
+        # No undo: the virtual view re-inserts text on every scroll, and an
+        # undo stack would keep all of it
+        self.left_text = tk.Text(self.left_text_frame, wrap="none", undo=False, font=self.text_font,
                                  xscrollcommand=self.hscrollbar.set)
         self.left_text.pack(side=tk.LEFT, fill=tk.BOTH, expand=True)
 
@@ -84,7 +156,7 @@ class FolderCompareApp:
                                           border=0, background="#f0f0f0", state="disabled",
                                           font=self.text_font)
         self.right_line_numbers.pack(side=tk.LEFT, fill=tk.Y)
-        self.right_text = tk.Text(self.right_text_frame, wrap="none", undo=True, font=self.text_font,
+        self.right_text = tk.Text(self.right_text_frame, wrap="none", undo=False, font=self.text_font,
                                   xscrollcommand=self.hscrollbar.set)
         self.right_text.pack(side=tk.LEFT, fill=tk.BOTH, expand=True)
 
@@ -92,8 +164,15 @@ class FolderCompareApp:
         self.vscrollbar = tk.Scrollbar(self.bottom_frame, orient="vertical", command=self.sync_scroll)
         self.vscrollbar.pack(side=tk.RIGHT, fill="y")
 
-        self.left_text.config(yscrollcommand=self.vscrollbar.set)
-        self.right_text.config(yscrollcommand=self.vscrollbar.set)
+        # Overview ruler: diff density of the whole file, click to jump
+        self.ruler = tk.Canvas(self.bottom_frame, width=RULER_WIDTH, highlightthickness=0, background="white")
+        self.ruler.pack(side=tk.RIGHT, fill="y")
+        self.ruler.bind("<Configure>", self.draw_ruler)
+        self.ruler.bind("<Button-1>", self.on_click_ruler)
+
+        self.left_text.config(yscrollcommand=lambda first, last: self.on_text_yscroll(0, first, last))
+        self.right_text.config(yscrollcommand=lambda first, last: self.on_text_yscroll(1, first, last))
+        self.left_text.bind("<Configure>", self.on_text_configure)
 
         # Disable mouse scroll on line numbers
         for widget in (self.left_line_numbers, self.right_line_numbers):
@@ -122,6 +201,11 @@ class FolderCompareApp:
         self.next_btn.pack(side=tk.LEFT, padx=5)
         self.last_btn = ttk.Button(self.button_frame, text="Last Diff", command=self.goto_last_diff)
         self.last_btn.pack(side=tk.LEFT, padx=5)
+        self.engine_var = tk.StringVar(value=DEFAULT_ENGINE)
+        self.engine_box = ttk.Combobox(self.button_frame, textvariable=self.engine_var, values=list(ENGINES),
+                                       state="readonly", width=10, font=self.ui_font)
+        self.engine_box.pack(side=tk.LEFT, padx=5)
+        self.engine_box.bind("<<ComboboxSelected>>", self.change_engine)
 
         # Font control buttons
         self.ui_plus = ttk.Button(self.button_frame, text="UI Font +", command=lambda: self.change_font(self.ui_font, 1))
@@ -138,6 +222,8 @@ class FolderCompareApp:
         self.text_font_select.pack(side=tk.LEFT, padx=5)
         self.reset_font_btn = ttk.Button(self.button_frame, text="Reset Fonts", command=self.reset_fonts)
         self.reset_font_btn.pack(side=tk.LEFT, padx=5)
+        self.diagnostics_btn = ttk.Button(self.button_frame, text="Diagnostics", command=self.open_diagnostics)
+        self.diagnostics_btn.pack(side=tk.LEFT, padx=5)
         self.help_btn = ttk.Button(self.button_frame, text="Help", command=self.about_and_help)
         self.help_btn.pack(side=tk.LEFT, padx=5)
 
@@ -153,10 +239,67 @@ class FolderCompareApp:
         # State
         self.left_folder = ""
         self.right_folder = ""
+        self.comparison = FolderComparison()
+        self.row_index = []
+        self.tree_mode = False
+        self.tree_iids = []
+        self.tree_rows = {}
         self.left_file = ""
         self.right_file = ""
         self.diff_ranges = []
+        self.diff_starts = ([], [])
         self.current_diff_index = -1
+        self.clicked_line = None
+        self.density = None
+        self.ruler_side = 0
+        self.virtual_view = False
+        self.view_lines = ([], [])
+        self.view_blocks = ([], [])
+        self.view_block_starts = ([], [])
+        self.view_top = [0, 0]
+        self.scroll_pending = {"x": [None, 0, 0], "y": [None, 0, 0]}
+        self.scroll_side = 0
+        self.scroll_job = None
+        self.scroll_events = 0
+        self.scroll_updates = 0
+        self.scroll_dropped = 0
+        self.mapped_files = ()
+        self.replace_hunks = []
+        self.replace_starts = ([], [])
+        self.inline_cache = {}
+        self.inline_tagged = set()
+        self.inline_job = None
+
+        # Background scan
+        self.executor = ThreadPoolExecutor()
+        self.scan_queue = queue.Queue()
+        self.scan_futures = []
+        self.scan_pending = 0
+        self.scan_listing = False
+        self.scan_id = 0
+        self.diff_executor = None
+        self.diff_future = None
+        self.diff_id = 0
+        self.diff_started = 0.0
+        self.stream_queue = None
+        self.stream_process = None
+        self.stream_files = None
+        self.stale_retries = 0
+        self.stream_pending = deque()
+        self.stream_opcodes = []
+        self.stream_done = False
+        self.stream_key = None
+        self.stream_job = None
+        self.scan_started = 0.0
+        self.diagnostics_dialog = None
+        self.diff_cache = DiffCache(diff_cache_mb)
+        self.watcher = None
+        self.watch_job = None
+        self.watch_pending = False
+        self.watch_snapshot = None
+        self.watch_info = ""
+        self.watch_interval = WATCH_INTERVAL_MS
+        self.digest_cache = DigestCache.open()
 
     # -------- Font handling --------
     def change_font(self, font_obj, delta):
@@ -195,26 +338,95 @@ class FolderCompareApp:
         help_info.insert(tk.END, 'Programmed by Python and Difflib.\n')
         help_info.insert(tk.END, '\nButtons:')
         help_info.insert(tk.END, '\nFirst/Prev/Next/Last Diff: Jump to the differences.')
+        help_info.insert(tk.END, '\nDiff engine: difflib, myers, patience, histogram or positional (line by line).')
         help_info.insert(tk.END, '\nUI Font +/-: Adjust font size of UI.')
         help_info.insert(tk.END, '\nContent Font +/-: Adjust font size of file content text.')
         help_info.insert(tk.END, '\nChoose UI/Content Font: Select fonts of UI or file content text.')
         help_info.insert(tk.END, '\nReset Font: Reset font settings.')
+        help_info.insert(tk.END, '\nDiagnostics: Time the read, diff and render phases, export as JSON or Chrome trace.')
         help_info.insert(tk.END, '\nHelp: Open this pop-up window.')
         help_info.insert(tk.END, '\n')
         help_info.insert(tk.END, '\nFile list:')
         help_info.insert(tk.END, '\nGreen: identical files')
         help_info.insert(tk.END, '\nLightblue: selected files')
+        help_info.insert(tk.END, '\nRecursive: compare whole folder trees, folders differ if anything below them differs')
+        help_info.insert(tk.END, '\nWatch: re-check files that change on disk')
+        help_info.insert(tk.END, '\nSelect Archive: use a .zip/.tar/.tar.gz as one side, nothing is extracted')
+        help_info.insert(tk.END, '\nSelect Revision: use a commit of a local git repository as one side')
         help_info.insert(tk.END, '\n')
         help_info.insert(tk.END, '\nContent text:')
         help_info.insert(tk.END, '\nGreen: added lines (only in right)')
         help_info.insert(tk.END, '\nRed: deleted lines (only in left)')
-        help_info.insert(tk.END, '\nYellow: modified lines')
+        help_info.insert(tk.END, '\nYellow: modified lines, gold: the changed words within them')
+        help_info.insert(tk.END, '\nBinary files are shown as a hex dump around the first difference')
+        help_info.insert(tk.END, '\nRuler beside the scrollbar: where the differences are, click to jump there')
+        help_info.insert(tk.END, '\nVery large files show their first lines at once and fill in hunks as they are found')
         help_info.insert(tk.END, '\n')
         help_info.insert(tk.END, '\nStatus bar:')
         help_info.insert(tk.END, '\nOpen gvim to compare the selected files by clicking the status bar.')
 
         ttk.Button(win, text="Close", command=on_close).grid(row=3, column=0, columnspan=2, pady=10)
 
+    # -------- Diagnostics --------
+    def open_diagnostics(self):
+        if self.diagnostics_dialog is not None:
+            self.diagnostics_dialog.lift()
+            return
+
+        win = tk.Toplevel(self.root)
+        self.diagnostics_dialog = win
+        win.title("Diagnostics")
+        win.transient(self.root)
+
+        def on_close():
+            self.diagnostics_dialog = None
+            win.destroy()
+        win.protocol("WM_DELETE_WINDOW", on_close)
+
+        enabled = tk.BooleanVar(value=TRACER.enabled)
+
+        def toggle():
+            TRACER.enabled = enabled.get()
+        ttk.Checkbutton(win, text="Record timings", variable=enabled, command=toggle).grid(
+            row=0, column=0, columnspan=5, padx=5, pady=5, sticky="w")
+
+        table = tk.Text(win, border=0, background="#f0f0f0", font=("courier", 10), width=100, height=16)
+        table.grid(row=1, column=0, columnspan=5, padx=5, pady=5)
+
+        def refresh():
+            table.config(state="normal")
+            table.delete("1.0", tk.END)
+            table.insert(tk.END, f"{'phase':16}{'count':>7}{'total ms':>11}{'mean ms':>10}{'max ms':>10}"
+                                 f"{'MB':>9}{'lines':>11}{'files':>9}\n")
+            for name, phase in sorted(TRACER.summary().items(), key=lambda item: -item[1]["total"]):
+                table.insert(tk.END, f"{name:16}{phase['count']:>7}{phase['total'] * 1000:>11.1f}"
+                                     f"{phase['total'] * 1000 / phase['count']:>10.2f}{phase['max'] * 1000:>10.2f}"
+                                     f"{phase.get('bytes', 0) / 2 ** 20:>9.1f}{phase.get('lines', 0):>11}"
+                                     f"{phase.get('files', 0):>9}\n")
+            coalesced = self.scroll_events - self.scroll_updates - self.scroll_dropped
+            table.insert(tk.END, f"\nScroll: {self.scroll_events} events, {self.scroll_updates} updates, "
+                                 f"{coalesced} coalesced, {self.scroll_dropped} dropped\n")
+            table.config(state="disabled")
+
+        def clear():
+            TRACER.clear()
+            self.scroll_events = self.scroll_updates = self.scroll_dropped = 0
+            refresh()
+
+        def export(chrome):
+            path = filedialog.asksaveasfilename(parent=win, defaultextension=".json",
+                                                filetypes=[("JSON", "*.json")])
+            if path:
+                with open(path, "w") as f:
+                    json.dump(TRACER.to_chrome() if chrome else TRACER.to_json(), f)
+
+        ttk.Button(win, text="Refresh", command=refresh).grid(row=2, column=0, padx=5, pady=10)
+        ttk.Button(win, text="Clear", command=clear).grid(row=2, column=1, padx=5, pady=10)
+        ttk.Button(win, text="Export JSON", command=lambda: export(False)).grid(row=2, column=2, padx=5, pady=10)
+        ttk.Button(win, text="Export Chrome trace", command=lambda: export(True)).grid(row=2, column=3, padx=5, pady=10)
+        ttk.Button(win, text="Close", command=on_close).grid(row=2, column=4, padx=5, pady=10)
+        refresh()
+
     def open_font_dialog(self, target_font, dialog_attr, title, apply_callback=None):
         if getattr(self, dialog_attr, None) is not None:
             getattr(self, dialog_attr).lift()
@@ -284,22 +496,7 @@ class FolderCompareApp:
         return "break"
 
     # -------- File handling --------
-    def load_folder(self, side):
-        def quick_compare_files(file1, file2):
-            with open(file1, "r", encoding="utf-8", errors="ignore") as f:
-                file1_lines = f.readlines()
-            with open(file2, "r", encoding="utf-8", errors="ignore") as f:
-                file2_lines = f.readlines()
-            matcher = difflib.SequenceMatcher(None, file1_lines, file2_lines)
-            opcodes = matcher.get_opcodes()
-            identical = True
-            for tag, i1, i2, j1, j2 in opcodes:
-                if tag == "equal": pass
-                else:
-                    identical = False
-                    break
-            return identical
-
+    def load_folder(self, side, kind="folder"):
         CONFIG_FILE = os.path.expanduser("~/.r2d2."+side+".cfg")
         last_dir = os.path.expanduser("~")
         if os.path.exists(CONFIG_FILE):
@@ -307,54 +504,338 @@ class FolderCompareApp:
                 for line in f.readlines():
                     last_dir = line.strip()
                     break
-        folder = filedialog.askdirectory(title="Open folder on "+side+" side", initialdir=last_dir)
+        if not os.path.isdir(last_dir):
+            # Last pick was an archive or a revision
+            last_dir = os.path.dirname(last_dir)
+        if kind == "archive":
+            # A zip/tar archive is compared like a folder, members are read in place
+            patterns = " ".join("*" + suffix for suffix in ARCHIVE_SUFFIXES)
+            folder = filedialog.askopenfilename(title="Open archive on "+side+" side", initialdir=last_dir,
+                                                filetypes=[("Archives", patterns), ("All files", "*")])
+        elif kind == "revision":
+            # A revision of a local git repository, listed from its tree object
+            folder = filedialog.askdirectory(title="Open git repository on "+side+" side", initialdir=last_dir)
+            rev = folder and simpledialog.askstring("Revision", "Commit, tag or branch (without '/'):",
+                                                    initialvalue="HEAD", parent=self.root)
+            if not rev:
+                return
+            folder = f"{folder}@{rev}"
+            if not is_revision(folder):
+                self.status_right.config(text=f"\nNot a git revision: {folder}")
+                return
+        else:
+            folder = filedialog.askdirectory(title="Open folder on "+side+" side", initialdir=last_dir)
         if folder:
             with open(CONFIG_FILE, 'w') as f:
                 f.write(folder)
         else:
             return
 
-        if self.left_folder and self.left_list:
-            for index in range(self.left_list.size()):
-                self.left_list.itemconfig(index, {'bg': ''})
-        if self.right_folder and self.right_list:
-            for index in range(self.right_list.size()):
-                self.right_list.itemconfig(index, {'bg': ''})
-
         if side == "left":
             self.left_topinfo.set(folder)
             self.left_folder = folder
-            self.left_list.delete(0, tk.END)
-            for f in sorted(os.listdir(folder)):
-                if os.path.isfile(os.path.join(folder, f)) and (not f.startswith('.')):
-                    self.left_list.insert(tk.END, f)
-                    if self.right_folder and self.right_list:
-                        right_index = -1
-                        for index in range(self.right_list.size()):
-                            if self.right_list.get(index) == f:
-                                right_index = index
-                                break
-                        if right_index>-1:
-                            if quick_compare_files(os.path.join(folder, f), os.path.join(self.right_folder, f)):
-                                self.left_list.itemconfig(self.left_list.size()-1, {'bg': 'lightgreen'})
-                                self.right_list.itemconfig(right_index, {'bg': 'lightgreen'})
         else:
             self.right_topinfo.set(folder)
             self.right_folder = folder
-            self.right_list.delete(0, tk.END)
-            for f in sorted(os.listdir(folder)):
-                if os.path.isfile(os.path.join(folder, f)) and (not f.startswith('.')):
-                    self.right_list.insert(tk.END, f)
-                    if self.left_folder and self.left_list:
-                        left_index = -1
-                        for index in range(self.left_list.size()):
-                            if self.left_list.get(index) == f:
-                                left_index = index
-                                break
-                        if left_index>-1:
-                            if quick_compare_files(os.path.join(folder, f), os.path.join(self.left_folder, f)):
-                                self.left_list.itemconfig(left_index, {'bg': 'lightgreen'})
-                                self.right_list.itemconfig(self.right_list.size()-1, {'bg': 'lightgreen'})
+        self.start_scan()
+
+    # -------- Background folder scan --------
+    def start_scan(self):
+        # Listing and identity checks run on the worker pool; results come back
+        # through scan_queue and are applied on the Tk thread by poll_scan.
+        self.cancel_scan()
+        self.scan_id += 1
+        scan_id = self.scan_id
+        self.status_left.config(text="Scanning ...")
+        # A new scan takes a fresh baseline with a new watcher; a snapshot still
+        # in flight belongs to the old scan and is dropped
+        self.watch_snapshot = None
+        self.watch_pending = False
+        if self.watcher is not None:
+            self.watcher.close()
+            self.watcher = None
+        future = self.executor.submit(self.scan_job, self.left_folder, self.right_folder,
+                                      self.recursive.get(), self.watch.get())
+        future.add_done_callback(lambda f: self.scan_queue.put((scan_id, "listed", None, f)))
+        self.scan_started = time.perf_counter()
+        self.scan_futures = [future]
+        self.scan_listing = True
+        self.root.after(SCAN_POLL_MS, self.poll_scan, scan_id)
+
+    @staticmethod
+    def scan_job(left_folder, right_folder, recursive, watching):
+        # Worker side of start_scan. In watch mode the baseline snapshot is taken
+        # before listing, so nothing that changes during the scan is missed.
+        snapshot = None
+        if watching and left_folder and right_folder:
+            snapshot = snapshot_pair(left_folder, right_folder, recursive)
+        return FolderComparison(left_folder, right_folder, recursive).pair(), snapshot
+
+    def cancel_scan(self):
+        for future in self.scan_futures:
+            future.cancel()
+        self.scan_futures = []
+        self.scan_pending = 0
+
+    def check_rows(self, scan_id):
+        for index in self.comparison.unchecked():
+            future = self.executor.submit(self.comparison.check, index, self.digest_cache)
+            future.add_done_callback(
+                lambda f, index=index: self.scan_queue.put((scan_id, "checked", index, f)))
+            self.scan_futures.append(future)
+            self.scan_pending += 1
+
+    def poll_scan(self, scan_id):
+        if scan_id != self.scan_id:
+            return
+        for _ in range(SCAN_BATCH):
+            try:
+                msg_id, kind, key, future = self.scan_queue.get_nowait()
+            except queue.Empty:
+                break
+            if msg_id != scan_id or future.cancelled():
+                continue
+            if kind == "listed":
+                self.scan_listing = False
+                if future.exception() is not None:
+                    self.status_left.config(text=f"Cannot scan folder: {future.exception()}")
+                    return
+                self.comparison, snapshot = future.result()
+                if snapshot is not None:
+                    self.apply_snapshot(snapshot)
+                with TRACER.span("populate", files=len(self.comparison.rows)):
+                    if self.tree_mode:
+                        self.populate_tree()
+                    else:
+                        self.populate_lists()
+                if self.left_folder and self.right_folder:
+                    self.check_rows(scan_id)
+            elif kind == "snapshot":
+                self.watch_pending = False
+                if future.exception() is not None:
+                    self.watch_info = f"Watch failed: {future.exception()}"
+                else:
+                    self.watch_changes(future.result(), scan_id)
+                    if scan_id != self.scan_id:
+                        return
+            else:
+                status = future.result() if future.exception() is None else DIFFERENT
+                self.set_row_status(key, status)
+                self.scan_pending -= 1
+
+        if self.scan_listing or self.watch_pending:
+            self.root.after(SCAN_POLL_MS, self.poll_scan, scan_id)
+            return
+        if not (self.left_folder and self.right_folder):
+            # Nothing to check yet; replace the "Scanning ..." from start_scan
+            self.status_left.config(text=f"{len(self.comparison.rows)} files listed; select the other folder to compare")
+            return
+        counts = self.comparison.counts()
+        summary = self.comparison.summary()
+        if self.digest_cache is not None:
+            summary += "  " + self.digest_cache.stats()
+        if self.watch_info:
+            summary += "  " + self.watch_info
+        if self.scan_pending:
+            total = counts[IDENTICAL] + counts[DIFFERENT] + counts[UNCHECKED]
+            checked = total - counts[UNCHECKED]
+            self.status_left.config(text=f"Comparing {checked}/{total} ...  " + summary)
+            self.root.after(SCAN_POLL_MS, self.poll_scan, scan_id)
+        else:
+            self.status_left.config(text=summary)
+            if not self.scan_futures:
+                return  # quiet watch tick, nothing was re-checked
+            if TRACER.enabled:
+                TRACER.add("load_folder", self.scan_started, time.perf_counter(), {"files": len(self.comparison.rows)})
+            self.scan_futures = []
+            if self.digest_cache is not None:
+                self.digest_cache.trim()
+            if self.tree_mode:
+                self.finish_tree()
+
+    def set_row_status(self, index, status):
+        self.comparison.set_status(index, status)
+        if self.tree_mode:
+            iid = self.tree_iids[index]
+            self.tree.set(iid, "status", status)
+            self.tree.item(iid, tags=(status,))
+            if status not in (IDENTICAL, UNCHECKED):
+                self.mark_dirs_different(self.tree.parent(iid))
+        else:
+            # Watch mode can turn a green row back into a different one
+            bg = 'lightgreen' if status == IDENTICAL else ''
+            left_index, right_index = self.row_index[index]
+            self.left_list.itemconfig(left_index, {'bg': bg})
+            self.right_list.itemconfig(right_index, {'bg': bg})
+
+    def populate_lists(self):
+        left_names = self.comparison.names("left")
+        right_names = self.comparison.names("right")
+        self.left_list.delete(0, tk.END)
+        self.right_list.delete(0, tk.END)
+        if left_names:
+            self.left_list.insert(tk.END, *left_names)
+        if right_names:
+            self.right_list.insert(tk.END, *right_names)
+
+        # Listbox index of every row on each side, used to color rows as results arrive
+        self.row_index = []
+        left_index = right_index = 0
+        for name, status in self.comparison.rows:
+            self.row_index.append((left_index, right_index))
+            if status == IDENTICAL:
+                self.left_list.itemconfig(left_index, {'bg': 'lightgreen'})
+                self.right_list.itemconfig(right_index, {'bg': 'lightgreen'})
+            if status != RIGHT_ONLY:
+                left_index += 1
+            if status != LEFT_ONLY:
+                right_index += 1
+
+    # -------- Watch mode --------
+    def toggle_watch(self):
+        if self.watch_job is not None:
+            self.root.after_cancel(self.watch_job)
+            self.watch_job = None
+        if self.watch.get():
+            self.watch_interval = WATCH_INTERVAL_MS
+            self.watch_job = self.root.after(self.watch_interval, self.watch_tick)
+        else:
+            self.watch_snapshot = None
+            self.watch_info = ""
+            if self.watcher is not None:
+                self.watcher.close()
+                self.watcher = None
+
+    def watch_tick(self):
+        self.watch_job = None
+        if not self.watch.get():
+            return
+        self.watch_job = self.root.after(self.watch_interval, self.watch_tick)
+        if not (self.left_folder and self.right_folder):
+            return
+        # Only one snapshot at a time and never while a scan is still running
+        if self.scan_listing or self.scan_pending or self.watch_pending:
+            return
+        scan_id = self.scan_id
+        future = self.executor.submit(snapshot_pair, self.left_folder, self.right_folder,
+                                      self.recursive.get(), self.watcher)
+        future.add_done_callback(lambda f: self.scan_queue.put((scan_id, "snapshot", None, f)))
+        self.watch_pending = True
+        self.root.after(SCAN_POLL_MS, self.poll_scan, scan_id)
+
+    def apply_snapshot(self, snapshot):
+        left_files, right_files, self.watcher, cost = snapshot
+        if left_files is not None:
+            self.watch_snapshot = (left_files, right_files)
+        # Back off on huge folders so snapshots stay a small share of the time
+        self.watch_interval = max(WATCH_INTERVAL_MS, int(cost * 1000 * WATCH_COST_FACTOR))
+        files = sum(len(side) for side in self.watch_snapshot) if self.watch_snapshot else 0
+        self.watch_info = (f"Watch: every {self.watch_interval / 1000:.1f}s, "
+                           f"snapshot {cost * 1000:.0f} ms, {files} files")
+
+    def watch_changes(self, snapshot, scan_id):
+        previous = self.watch_snapshot
+        self.apply_snapshot(snapshot)
+        if snapshot[0] is None or previous is None:
+            return
+        left_added, left_removed, left_modified = changed_names(previous[0], snapshot[0])
+        right_added, right_removed, right_modified = changed_names(previous[1], snapshot[1])
+        if left_added or left_removed or right_added or right_removed:
+            # The file lists changed: pair everything again
+            self.start_scan()
+            return
+        modified = left_modified | right_modified
+        self.watch_info += f", {len(modified)} changed"
+        if not modified:
+            return
+        for index, (name, status) in enumerate(self.comparison.rows):
+            if name in modified and status in (IDENTICAL, DIFFERENT):
+                self.set_row_status(index, UNCHECKED)
+        self.check_rows(scan_id)
+        if (self.left_file and self.right_file
+                and any(os.path.join(self.left_folder, name) == self.left_file
+                        or os.path.join(self.right_folder, name) == self.right_file for name in modified)):
+            self.compare_files()
+
+    # -------- Recursive tree view --------
+    def toggle_recursive(self):
+        self.tree_mode = self.recursive.get()
+        if self.tree_mode:
+            self.left_list.pack_forget()
+            self.right_list.pack_forget()
+            self.tree_frame.pack(side=tk.BOTTOM, fill=tk.BOTH, expand=True, before=self.left_frame)
+        else:
+            self.tree_frame.pack_forget()
+            self.left_list.pack(fill=tk.BOTH, expand=True)
+            self.right_list.pack(fill=tk.BOTH, expand=True)
+        if self.left_folder or self.right_folder:
+            self.start_scan()
+
+    def populate_tree(self):
+        self.tree.delete(*self.tree.get_children())
+        self.tree_iids = []
+        self.tree_rows = {}
+        dirs = {"": ""}
+        for index, (path, status) in enumerate(self.comparison.rows):
+            parent_path, name = os.path.split(path)
+            parent = dirs.get(parent_path)
+            if parent is None:
+                # Create the missing directory nodes from the top down
+                parent = ""
+                walked = ""
+                for part in parent_path.split(os.sep):
+                    walked = os.path.join(walked, part)
+                    if walked not in dirs:
+                        dirs[walked] = self.tree.insert(dirs[os.path.dirname(walked)], tk.END,
+                                                        iid="d:" + walked, text=part, values=("",))
+                    parent = dirs[walked]
+            iid = self.tree.insert(parent, tk.END, iid="f:" + path, text=name,
+                                   values=(status,), tags=(status,))
+            self.tree_iids.append(iid)
+            self.tree_rows[iid] = index
+            if status in (LEFT_ONLY, RIGHT_ONLY):
+                self.mark_dirs_different(parent)
+
+    def mark_dirs_different(self, iid):
+        # A directory differs as soon as any descendant differs
+        while iid and self.tree.set(iid, "status") != DIFFERENT:
+            self.tree.set(iid, "status", DIFFERENT)
+            self.tree.item(iid, tags=(DIFFERENT,))
+            iid = self.tree.parent(iid)
+
+    def finish_tree(self):
+        # Recompute every directory from its files; in watch mode a directory
+        # can go from different back to identical.
+        different = set()
+        for index, (path, status) in enumerate(self.comparison.rows):
+            if status != IDENTICAL:
+                iid = self.tree.parent(self.tree_iids[index])
+                while iid and iid not in different:
+                    different.add(iid)
+                    iid = self.tree.parent(iid)
+        pending = list(self.tree.get_children())
+        while pending:
+            iid = pending.pop()
+            if iid.startswith("d:"):
+                status = DIFFERENT if iid in different else IDENTICAL
+                self.tree.set(iid, "status", status)
+                self.tree.item(iid, tags=(status,))
+            pending.extend(self.tree.get_children(iid))
+
+    def tree_selected(self, event):
+        selection = self.tree.selection()
+        if not selection or selection[0] not in self.tree_rows:
+            return
+        path, status = self.comparison.rows[self.tree_rows[selection[0]]]
+        if status == RIGHT_ONLY or status == LEFT_ONLY:
+            side = "left" if status == LEFT_ONLY else "right"
+            self.status_left.config(text=f"Only in {side}: {path}")
+            return
+        self.left_file = os.path.join(self.left_folder, path)
+        self.right_file = os.path.join(self.right_folder, path)
+        self.root.clipboard_clear()
+        self.root.clipboard_append(self.right_file)
+        self.compare_files()
 
     def file_selected(self, event):
         if self.left_list.curselection():
@@ -369,45 +850,166 @@ class FolderCompareApp:
             self.compare_files()
 
     def update_line_numbers(self, number_widget, total_lines):
-        number_widget.config(state="normal")
-        number_widget.delete("1.0", tk.END)
-        for i in range(1, total_lines + 1):
-            number_widget.insert(tk.END, f"{i}\n")
-        number_widget.config(state="disabled")
-
-    def compare_files(self):
-        with open(self.left_file, "r", encoding="utf-8", errors="ignore") as f:
-            left_lines = f.readlines()
-        with open(self.right_file, "r", encoding="utf-8", errors="ignore") as f:
-            right_lines = f.readlines()
+        with TRACER.span("line numbers", lines=total_lines):
+            number_widget.config(state="normal")
+            number_widget.delete("1.0", tk.END)
+            if total_lines:
+                number_widget.insert(tk.END, "\n".join(map(str, range(1, total_lines + 1))) + "\n")
+            number_widget.config(state="disabled")
+
+    def fill_panes(self, left_lines, right_lines, opcodes):
+        # One Text.insert per pane: each opcode block is joined into a single
+        # string and passed with its tag as (chars, tagList) pairs.
+        left_args, right_args = [], []
+        for tag, i1, i2, j1, j2 in opcodes:
+            tags = () if tag == "equal" else (tag,)
+            if i1 < i2:
+                left_args += ["".join(left_lines[i1:i2]), tags]
+            if j1 < j2:
+                right_args += ["".join(right_lines[j1:j2]), tags]
+        with TRACER.span("insert", lines=len(left_lines) + len(right_lines)):
+            if left_args:
+                self.left_text.insert(tk.END, *left_args)
+            if right_args:
+                self.right_text.insert(tk.END, *right_args)
+        self.update_line_numbers(self.left_line_numbers, len(left_lines))
+        self.update_line_numbers(self.right_line_numbers, len(right_lines))
+
+    def compare_files(self, retry=False):
+        # The diff runs in a worker process. A newer selection cancels the job if
+        # it hasn't started yet; otherwise its result is dropped by poll_diff.
+        # retry: called again by retry_stale for the same pair.
+        if not retry:
+            self.stale_retries = 0
+        self.diff_id += 1
+        if self.diff_future is not None:
+            self.diff_future.cancel()
+        self.stop_stream()
+        self.status_left.config(text=f"Left: {self.left_file}\nRight: {self.right_file}")
+        left_file, right_file = self.left_file, self.right_file
+        engine = self.engine_var.get()
+        try:
+            # Only stat data here: reading anything (even the binary sniff)
+            # can mean a whole git blob, so that happens in the worker
+            key = self.diff_cache.key(left_file, right_file, engine)
+            size = max(source_stat(left_file).st_size, source_stat(right_file).st_size)
+            pins = source_pins(left_file, right_file)
+        except OSError as e:
+            self.status_right.config(text=f"\nCannot compare: {e}")
+            return
+        result = self.diff_cache.get(key)
+        if result is not None:
+            with TRACER.span("compare_files", cached=1):
+                self.show_result(left_file, right_file, result)
+            return
+        if size > PROGRESSIVE_BYTES:
+            self.start_stream(left_file, right_file, engine, key, pins)
+            return
+        if self.diff_executor is None:
+            self.diff_executor = ProcessPoolExecutor(max_workers=DIFF_WORKERS, mp_context=MP_CONTEXT)
+        self.diff_future = self.diff_executor.submit(traced_job, TRACER.enabled, compare_job, left_file, right_file,
+                                                     engine, pins)
+        self.status_right.config(text="\nComputing diff ...")
+        self.diff_started = time.perf_counter()
+        self.root.after(DIFF_POLL_MS, self.poll_diff, self.diff_id, left_file, right_file, key)
+
+    def poll_diff(self, diff_id, left_file, right_file, key):
+        if diff_id != self.diff_id:
+            return
+        future = self.diff_future
+        if not future.done():
+            self.root.after(DIFF_POLL_MS, self.poll_diff, diff_id, left_file, right_file, key)
+            return
+        self.diff_future = None
+        try:
+            result, spans = future.result()
+        except BrokenProcessPool as e:
+            # A worker died (e.g. out of memory); start a fresh pool next time
+            self.diff_executor = None
+            self.status_right.config(text=f"\nCannot compare: {e}")
+            return
+        except Exception as e:
+            self.status_right.config(text=f"\nCannot compare: {e}")
+            return
+        TRACER.extend(spans)
+        # Binary files never reach the line diff: a sniffed NUL byte sends
+        # them to the byte compare and the hex summary view
+        kind, result = result
+        with TRACER.span("show"):
+            if kind == "binary":
+                self.show_binary(result)
+            else:
+                self.diff_cache.put(key, result)
+                self.show_result(left_file, right_file, result)
+        if TRACER.enabled:
+            TRACER.add("compare_files", self.diff_started, time.perf_counter())
+
+    def show_result(self, left_file, right_file, result):
+        opcodes, left_index, right_index = result
+        try:
+            # Reuses the worker's line index; the opcodes only fit it
+            left_lines, right_lines = reopen_pair(left_file, right_file, left_index, right_index)
+        except StaleIndexError as e:
+            self.retry_stale(e)
+            return
+        except OSError as e:
+            self.status_right.config(text=f"\nCannot compare: {e}")
+            return
+        self.show_diff(left_lines, right_lines, opcodes)
+
+    def retry_stale(self, error):
+        # A file changed after the worker read it, so its result is dropped
+        # and the pair diffed again; one that keeps changing is given up on
+        if self.stale_retries >= STALE_RETRIES:
+            self.status_right.config(text=f"\nCannot compare: {error}")
+            return
+        self.stale_retries += 1
+        self.compare_files(retry=True)
+
+    def show_binary(self, result):
+        # Hex rows around the first difference, shown like a small text diff:
+        # differing rows are replace hunks, so the changed bytes get the
+        # intra-line highlight too.
+        first, blocks, total, left_rows, right_rows = result
+        opcodes = []
+        for k in range(max(len(left_rows), len(right_rows))):
+            if k >= len(right_rows):
+                op = ("delete", k, k + 1, len(right_rows), len(right_rows))
+            elif k >= len(left_rows):
+                op = ("insert", len(left_rows), len(left_rows), k, k + 1)
+            else:
+                op = ("equal" if left_rows[k] == right_rows[k] else "replace", k, k + 1, k, k + 1)
+            if opcodes and opcodes[-1][0] == op[0]:
+                tag, i1, i2, j1, j2 = opcodes[-1]
+                op = (tag, i1, op[2], j1, op[4])
+                opcodes.pop()
+            opcodes.append(op)
+        self.show_diff(left_rows, right_rows, opcodes)
+        self.status_right.config(text=f"\n{format_binary(first, blocks, total)}")
+
+    def show_diff(self, left_lines, right_lines, opcodes, virtual=False):
+        # Lines stay in the mapped files and are decoded only when rendered
+        for mapped in self.mapped_files:
+            if isinstance(mapped, MappedFile):
+                mapped.close()
+        self.mapped_files = (left_lines, right_lines)
 
         self.left_text.delete("1.0", tk.END)
         self.right_text.delete("1.0", tk.END)
 
         self.diff_ranges = []
+        self.diff_starts = ([], [])
         self.current_diff_index = -1
-
-        matcher = difflib.SequenceMatcher(None, left_lines, right_lines)
-        opcodes = matcher.get_opcodes()
-
-        #max_lines = max(len(left_lines), len(right_lines))
-        self.update_line_numbers(self.left_line_numbers, len(left_lines))
-        self.update_line_numbers(self.right_line_numbers, len(right_lines))
-
-        for tag, i1, i2, j1, j2 in opcodes:
-            if tag == "equal":
-                for i in range(i1, i2):
-                    self.left_text.insert(tk.END, left_lines[i])
-                for j in range(j1, j2):
-                    self.right_text.insert(tk.END, right_lines[j])
-            else:
-                self.diff_ranges.append(((i1+1, i2), (j1+1, j2)))
-                if tag in ("replace", "delete"):
-                    for i in range(i1, i2):
-                        self.left_text.insert(tk.END, left_lines[i], tag)
-                if tag in ("replace", "insert"):
-                    for j in range(j1, j2):
-                        self.right_text.insert(tk.END, right_lines[j], tag)
+        self.clicked_line = None
+        # The ruler follows the longer side, like the scrollbar
+        self.ruler_side = 0 if len(left_lines) >= len(right_lines) else 1
+        self.density = DiffDensity(max(len(left_lines), len(right_lines)))
+        self.replace_hunks = []
+        self.replace_starts = ([], [])
+        self.view_blocks = ([], [])
+        self.view_block_starts = ([], [])
+        self.inline_cache = {}
+        self.inline_tagged = set()
 
         self.left_text.tag_config("replace", background="lightyellow")
         self.right_text.tag_config("replace", background="lightyellow")
@@ -415,12 +1017,339 @@ class FolderCompareApp:
         self.right_text.tag_config("insert", background="lightgreen")
         self.left_text.tag_config("current_diff", background="orange")
         self.right_text.tag_config("current_diff", background="orange")
+        self.left_text.tag_config("inline", background="gold")
+        self.right_text.tag_config("inline", background="gold")
+
+        self.virtual_view = virtual or max(len(left_lines), len(right_lines)) > VIRTUAL_THRESHOLD
+        self.add_hunks(opcodes)
+        if self.virtual_view:
+            self.view_lines = (left_lines, right_lines)
+            self.view_top = [0, 0]
+            self.render_view()
+        else:
+            self.fill_panes(left_lines, right_lines, opcodes)
+            self.schedule_inline()
+        self.draw_ruler()
 
-        self.status_left.config(text=f"Left: {self.left_file}\nRight: {self.right_file}")
         if self.diff_ranges:
-            self.status_right.config(text=f"\n{len(self.diff_ranges)} differences")
+            self.status_right.config(text=f"{self.diff_cache.stats()}\n{len(self.diff_ranges)} differences")
+        else:
+            self.status_right.config(text=f"{self.diff_cache.stats()}\nFiles are identical")
+
+    def add_hunks(self, opcodes):
+        # Appends the non-equal opcodes to the navigation, intra-line and view
+        # tables; a progressive diff calls this once per batch.
+        for tag, i1, i2, j1, j2 in opcodes:
+            if tag == "equal":
+                continue
+            self.diff_ranges.append(((i1+1, i2), (j1+1, j2)))
+            self.diff_starts[0].append(i1 + 1)
+            self.diff_starts[1].append(j1 + 1)
+            self.density.add(*((i1, i2), (j1, j2))[self.ruler_side])
+            if tag == "replace":
+                self.replace_hunks.append((i1, i2, j1, j2))
+                self.replace_starts[0].append(i1)
+                self.replace_starts[1].append(j1)
+            if self.virtual_view:
+                for side, start, end in ((0, i1, i2), (1, j1, j2)):
+                    if start < end:
+                        self.view_blocks[side].append((start, end, tag))
+                        self.view_block_starts[side].append(start)
+
+    # -------- Progressive diff --------
+    # Files over PROGRESSIVE_BYTES are diffed by stream_job in a process of
+    # their own, which sends hunks while the engine is still running; a newer
+    # selection terminates it, even in the middle of an engine call. The head
+    # of both files is shown at once; the virtual view takes over when the
+    # line indexes arrive and grows in after_idle batches of APPEND_BATCH.
+    def start_stream(self, left_file, right_file, engine, key, pins):
+        # The preview reads plain files only (a member may have to be read
+        # whole) and is dropped if it looks binary
+        left_head, right_head = [], []
+        if split_source(left_file) is None and split_source(right_file) is None:
+            try:
+                rows = self.visible_rows()
+                left_head = head_lines(left_file, rows)
+                right_head = head_lines(right_file, rows)
+            except OSError as e:
+                self.status_right.config(text=f"\nCannot compare: {e}")
+                return
+            if any("\0" in line for line in left_head + right_head):
+                left_head, right_head = [], []
+        with TRACER.span("preview", lines=len(left_head) + len(right_head)):
+            self.show_diff(left_head, right_head, list(iter_opcodes(left_head, right_head, engine)))
+        self.status_right.config(text="\nComputing diff ...")
+        self.stream_queue = MP_CONTEXT.Queue()
+        self.stream_pending.clear()
+        self.stream_opcodes = []
+        self.stream_done = False
+        self.stream_key = key
+        self.stream_files = (left_file, right_file)
+        self.diff_started = time.perf_counter()
+        self.stream_process = MP_CONTEXT.Process(target=stream_job, daemon=True,
+                                                 args=(self.stream_queue, TRACER.enabled, left_file, right_file,
+                                                       engine, pins))
+        self.stream_process.start()
+        self.root.after(DIFF_POLL_MS, self.poll_stream, self.diff_id)
+
+    def stop_stream(self):
+        if self.stream_job is not None:
+            self.root.after_cancel(self.stream_job)
+            self.stream_job = None
+        if self.stream_process is not None:
+            if self.stream_process.is_alive():
+                self.stream_process.terminate()
+            self.stream_process = None
+            # A process killed while writing can leave the queue half written
+            self.stream_queue.cancel_join_thread()
+            self.stream_queue = None
+
+    def poll_stream(self, diff_id):
+        if diff_id != self.diff_id:
+            return
+        # Checked before draining: a process that had already exited has no
+        # messages left in flight once the queue reads empty
+        exited = not self.stream_process.is_alive()
+        while True:
+            try:
+                kind, payload = self.stream_queue.get_nowait()
+            except queue.Empty:
+                break
+            if kind == "error":
+                self.stop_stream()
+                self.status_right.config(text=f"\nCannot compare: {payload}")
+                return
+            if kind == "binary":
+                self.stop_stream()
+                self.show_binary(payload)
+                return
+            if kind == "files":
+                try:
+                    left_lines, right_lines = reopen_pair(*self.stream_files, *payload)
+                except StaleIndexError as e:
+                    self.stop_stream()
+                    self.retry_stale(e)
+                    return
+                except OSError as e:
+                    self.stop_stream()
+                    self.status_right.config(text=f"\nCannot compare: {e}")
+                    return
+                self.show_diff(left_lines, right_lines, [], virtual=True)
+                if TRACER.enabled:
+                    TRACER.add("first view", self.diff_started, time.perf_counter())
+                self.stream_status()
+            elif kind == "hunks":
+                self.stream_pending.extend(payload)
+            else:
+                TRACER.extend(payload)
+                self.stream_done = True
+            if self.stream_job is None:
+                self.stream_job = self.root.after_idle(self.append_stream, diff_id)
+            if self.stream_done:
+                self.stream_process.join()
+                self.stream_process = None
+                return
+        if exited:
+            code = self.stream_process.exitcode
+            self.stop_stream()
+            self.status_right.config(text=f"\nCannot compare: diff process exited with code {code}")
+            return
+        self.root.after(DIFF_POLL_MS, self.poll_stream, diff_id)
+
+    def append_stream(self, diff_id):
+        self.stream_job = None
+        if diff_id != self.diff_id:
+            return
+        pending = self.stream_pending
+        opcodes = [pending.popleft() for _ in range(min(APPEND_BATCH, len(pending)))]
+        if opcodes:
+            if not self.stream_opcodes and TRACER.enabled:
+                TRACER.add("first hunks", self.diff_started, time.perf_counter())
+            self.stream_opcodes += opcodes
+            self.add_hunks(opcodes)
+            self.draw_ruler()
+            # Later hunks only change the panes if they start inside them
+            rows = self.visible_rows()
+            if opcodes[0][1] < self.view_top[0] + rows or opcodes[0][3] < self.view_top[1] + rows:
+                self.render_view()
+        if pending:
+            self.stream_job = self.root.after_idle(self.append_stream, diff_id)
+        elif self.stream_done:
+            left_lines, right_lines = self.mapped_files
+            if self.stream_key is not None:
+                self.diff_cache.put(self.stream_key, (self.stream_opcodes, left_lines.line_index, right_lines.line_index))
+            if TRACER.enabled:
+                TRACER.add("compare_files", self.diff_started, time.perf_counter(), {"streamed": 1})
+            self.stream_status()
+        else:
+            self.stream_status()
+
+    def stream_status(self):
+        # Leaves a "Diff i/n" message from goto_diff in place while streaming
+        if self.stream_done:
+            if self.diff_ranges:
+                text = f"{self.diff_cache.stats()}\n{len(self.diff_ranges)} differences"
+            else:
+                text = f"{self.diff_cache.stats()}\nFiles are identical"
+        elif self.current_diff_index < 0:
+            text = f"{self.diff_cache.stats()}\n{len(self.diff_ranges)} differences so far ..."
         else:
-            self.status_right.config(text="\nFiles are identical")
+            return
+        self.status_right.config(text=text)
+
+    def change_engine(self, event):
+        if self.left_file and self.right_file:
+            self.compare_files()
+
+    # -------- Virtualized view --------
+    # Large files keep their lines and diff blocks in Python; only the rows that
+    # fit in the panes (plus VIRTUAL_MARGIN) are inserted into the Text widgets,
+    # and the shared scrollbar is driven from view_top instead of Text.yview.
+    def visible_rows(self):
+        linespace = max(1, self.text_font.metrics("linespace"))
+        return max(1, self.left_text.winfo_height() // linespace) + VIRTUAL_MARGIN
+
+    def clamp_view_top(self, rows):
+        for side in (0, 1):
+            last = max(0, len(self.view_lines[side]) - rows + VIRTUAL_MARGIN)
+            self.view_top[side] = max(0, min(self.view_top[side], last))
+
+    def render_view(self):
+        with TRACER.span("render view"):
+            self.render_rows()
+
+    def render_rows(self):
+        rows = self.visible_rows()
+        self.clamp_view_top(rows)
+        current = self.diff_ranges[self.current_diff_index] if self.current_diff_index >= 0 else None
+        panes = ((self.left_text, self.left_line_numbers), (self.right_text, self.right_line_numbers))
+        windows = []
+        for side, (text, numbers) in enumerate(panes):
+            lines = self.view_lines[side]
+            top = self.view_top[side]
+            bottom = min(len(lines), top + rows)
+            windows.append((top, bottom))
+
+            text.delete("1.0", tk.END)
+            text.insert("1.0", "".join(lines[top:bottom]))
+            blocks = self.view_blocks[side]
+            first = max(0, bisect.bisect_right(self.view_block_starts[side], top) - 1)
+            for start, end, tag in blocks[first:]:
+                if start >= bottom:
+                    break
+                if end > top:
+                    text.tag_add(tag, f"{max(start, top) - top + 1}.0", f"{min(end, bottom) - top + 1}.0")
+            if current is not None:
+                start, end = current[side]
+                start, end = max(start - 1, top), min(end, bottom)
+                if start < end:
+                    text.tag_add("current_diff", f"{start - top + 1}.0", f"{end - top}.0 lineend")
+
+            numbers.config(state="normal")
+            numbers.delete("1.0", tk.END)
+            numbers.insert("1.0", "\n".join(str(i) for i in range(top + 1, bottom + 1)))
+            numbers.config(state="disabled")
+        self.tag_inline(*windows)
+
+        # The longer side defines the scrollbar position
+        side = 0 if len(self.view_lines[0]) >= len(self.view_lines[1]) else 1
+        total = max(1, len(self.view_lines[side]))
+        top = self.view_top[side]
+        self.vscrollbar.set(top / total, min(1.0, (top + rows) / total))
+
+    def on_text_yscroll(self, side, first, last):
+        # Full panes: the scrollbar follows the longer side, like the ruler
+        if not self.virtual_view:
+            if side == self.ruler_side:
+                self.vscrollbar.set(first, last)
+            self.schedule_inline()
+
+    def on_text_configure(self, event):
+        if self.virtual_view:
+            self.render_view()
+
+    # -------- Intra-line highlighting --------
+    # Replace hunks are only painted whole-line yellow up front. The changed
+    # words inside a line pair are diffed the first time the pair is shown
+    # (scrolled into view or picked by goto_diff) and memoized per hunk.
+    def schedule_inline(self):
+        if self.inline_job is None and self.replace_hunks:
+            self.inline_job = self.root.after_idle(self.show_inline)
+
+    def show_inline(self):
+        self.inline_job = None
+        if not self.virtual_view:
+            self.tag_inline(self.visible_window(self.left_text), self.visible_window(self.right_text))
+
+    def visible_window(self, text):
+        # 0-based [top, bottom) of the lines currently shown in a full Text pane
+        top = int(text.index("@0,0").split(".")[0]) - 1
+        bottom = int(text.index(f"@0,{text.winfo_height()}").split(".")[0])
+        return top, bottom
+
+    def inline_pairs(self, left_window, right_window):
+        # (hunk, k) for the k-th line pair of each replace hunk in either window
+        hunks = self.replace_hunks
+        first = min(bisect.bisect_right(self.replace_starts[0], left_window[0]),
+                    bisect.bisect_right(self.replace_starts[1], right_window[0]))
+        for hunk in range(max(0, first - 1), len(hunks)):
+            i1, i2, j1, j2 = hunks[hunk]
+            if i1 >= left_window[1] and j1 >= right_window[1]:
+                break
+            lo = max(0, min(left_window[0] - i1, right_window[0] - j1))
+            hi = min(i2 - i1, j2 - j1, max(left_window[1] - i1, right_window[1] - j1))
+            for k in range(lo, hi):
+                yield hunk, k
+
+    def hunk_inline_spans(self, hunk, k):
+        pairs = self.inline_cache.setdefault(hunk, {})
+        if k not in pairs:
+            i1, i2, j1, j2 = self.replace_hunks[hunk]
+            left_lines, right_lines = self.mapped_files
+            pairs[k] = inline_spans(left_lines[i1 + k], right_lines[j1 + k])
+        return pairs[k]
+
+    def tag_inline(self, left_window, right_window):
+        # Full panes keep their tags, so each pair is tagged once; the virtual
+        # view re-inserts its text and re-tags from the cache on every render.
+        offsets = (left_window[0], right_window[0]) if self.virtual_view else (0, 0)
+        texts = (self.left_text, self.right_text)
+        windows = (left_window, right_window)
+        for hunk, k in self.inline_pairs(left_window, right_window):
+            if not self.virtual_view:
+                if (hunk, k) in self.inline_tagged:
+                    continue
+                self.inline_tagged.add((hunk, k))
+            starts = self.replace_hunks[hunk][0::2]
+            for side, spans in enumerate(self.hunk_inline_spans(hunk, k)):
+                line = starts[side] + k
+                if not spans or (self.virtual_view and not windows[side][0] <= line < windows[side][1]):
+                    continue
+                row = line - offsets[side] + 1
+                indices = []
+                for start, end in spans:
+                    indices += [f"{row}.{start}", f"{row}.{end}"]
+                texts[side].tag_add("inline", *indices)
+
+    # -------- Overview ruler --------
+    def draw_ruler(self, event=None):
+        # One rectangle per run of ruler rows with the same shade
+        self.ruler.delete("all")
+        if self.density is None:
+            return
+        width = self.ruler.winfo_width()
+        for top, bottom, color in self.density.bars(max(1, self.ruler.winfo_height())):
+            self.ruler.create_rectangle(0, top, width, bottom, fill=color, outline="")
+
+    def on_click_ruler(self, event):
+        # Jump to the diff nearest to the clicked spot
+        if self.density is None:
+            return
+        fraction = min(max(event.y / max(1, self.ruler.winfo_height()), 0.0), 1.0)
+        if not self.diff_ranges:
+            self.sync_scroll("moveto", fraction)
+            return
+        self.goto_diff(self.density.nearest(self.diff_starts[self.ruler_side], fraction))
 
     # -------- Diff navigation --------
     def goto_diff(self, index):
@@ -432,6 +1361,13 @@ class FolderCompareApp:
         self.current_diff_index = index
         (l_start, l_end), (r_start, r_end) = self.diff_ranges[index]
 
+        if self.virtual_view:
+            self.view_top = [l_start - 1 - VIRTUAL_CONTEXT, r_start - 1 - VIRTUAL_CONTEXT]
+            self.render_view()
+            self.status_right.config(text=f"Diff {self.current_diff_index+1}/{len(self.diff_ranges)}\n"
+                                          f"(Left {l_start}-{l_end}, Right {r_start}-{r_end})")
+            return
+
         self.left_text.tag_remove("current_diff", "1.0", tk.END)
         self.right_text.tag_remove("current_diff", "1.0", tk.END)
 
@@ -444,6 +1380,7 @@ class FolderCompareApp:
         self.right_text.see(f"{r_start}.0")
         self.left_line_numbers.see(f"{l_start}.0")
         self.right_line_numbers.see(f"{r_start}.0")
+        self.schedule_inline()
 
         self.status_right.config(text=f"Diff {self.current_diff_index+1}/{len(self.diff_ranges)}\n"
                                       f"(Left {l_start}-{l_end}, Right {r_start}-{r_end})")
@@ -451,12 +1388,27 @@ class FolderCompareApp:
     def goto_next_diff(self):
         if not self.diff_ranges:
             return
+        if self.clicked_line:
+            # diff_starts is sorted on both sides: next diff after the clicked line
+            side, line = self.clicked_line
+            i = bisect.bisect_right(self.diff_starts[side], line)
+            if i < len(self.diff_ranges):
+                self.goto_diff(i)
+                self.clicked_line = None
+                return
         if self.current_diff_index < len(self.diff_ranges) - 1:
             self.goto_diff(self.current_diff_index + 1)
 
     def goto_prev_diff(self):
         if not self.diff_ranges:
             return
+        if self.clicked_line:
+            side, line = self.clicked_line
+            i = bisect.bisect_left(self.diff_starts[side], line) - 1
+            if i >= 0:
+                self.goto_diff(i)
+                self.clicked_line = None
+                return
         if self.current_diff_index > 0:
             self.goto_diff(self.current_diff_index - 1)
 
@@ -467,16 +1419,86 @@ class FolderCompareApp:
         self.goto_diff(len(self.diff_ranges) - 1)
 
     # -------- Sync scrolling --------
+    # Scrollbar and wheel events only add to scroll_pending; one after_idle
+    # callback per burst applies the sum, so fast trackpad scrolling redraws the
+    # four panes once instead of once per event. The scrolled pane leads and
+    # the other follows through the diff ranges (aligned_line), which keeps
+    # hunks side by side when the two files have different line counts.
+    def request_scroll(self, axis, side, *args):
+        self.scroll_events += 1
+        pending = self.scroll_pending[axis]
+        if args[0] == "moveto":
+            if pending != [None, 0, 0]:
+                # An absolute position makes what was queued before it moot
+                self.scroll_dropped += 1
+            pending[:] = [float(args[1]), 0, 0]
+        else:
+            pending[1 if args[2] == "units" else 2] += int(args[1])
+        if axis == "y":
+            self.scroll_side = side
+        if self.scroll_job is None:
+            self.scroll_job = self.root.after_idle(self.flush_scroll)
+
+    def flush_scroll(self):
+        self.scroll_job = None
+        self.scroll_updates += 1
+        xscroll, yscroll = self.scroll_pending["x"], self.scroll_pending["y"]
+        self.scroll_pending = {"x": [None, 0, 0], "y": [None, 0, 0]}
+        with TRACER.span("scroll"):
+            if yscroll != [None, 0, 0]:
+                self.apply_yscroll(self.scroll_side, *yscroll)
+            if xscroll != [None, 0, 0]:
+                self.apply_xscroll(*xscroll)
+
+    def apply_yscroll(self, side, moveto, units, pages):
+        if self.virtual_view:
+            lines = len(self.view_lines[side])
+            top = self.view_top[side] if moveto is None else int(moveto * lines)
+            top += units + pages * (self.visible_rows() - VIRTUAL_MARGIN)
+            self.view_top[side] = max(0, min(top, lines - 1))
+            self.view_top[1 - side] = self.aligned_line(side, self.view_top[side])
+            self.render_view()
+            return
+        panes = ((self.left_text, self.left_line_numbers), (self.right_text, self.right_line_numbers))
+        text, numbers = panes[side]
+        if moveto is not None:
+            text.yview("moveto", moveto)
+        if units:
+            text.yview_scroll(units, "units")
+        if pages:
+            text.yview_scroll(pages, "pages")
+        top = int(text.index("@0,0").split(".")[0]) - 1
+        numbers.yview(f"{top + 1}.0")
+        other = self.aligned_line(side, top)
+        for widget in panes[1 - side]:
+            widget.yview(f"{other + 1}.0")
+
+    def apply_xscroll(self, moveto, units, pages):
+        for text in (self.left_text, self.right_text):
+            if moveto is not None:
+                text.xview("moveto", moveto)
+            if units:
+                text.xview_scroll(units, "units")
+            if pages:
+                text.xview_scroll(pages, "pages")
+        self.hscrollbar.set(*self.left_text.xview())
+
+    def aligned_line(self, side, line):
+        # 0-based line of the other side that sits next to line: same offset
+        # into the hunk (clamped to its end), or the same distance past it
+        index = bisect.bisect_right(self.diff_starts[side], line + 1) - 1
+        if index < 0:
+            return line
+        (start, end), (other_start, other_end) = self.diff_ranges[index][side], self.diff_ranges[index][1 - side]
+        if line < end:
+            return other_start - 1 + min(line - (start - 1), other_end - (other_start - 1))
+        return other_end + line - end
+
     def sync_scroll(self, *args):
-        self.left_text.yview(*args)
-        self.right_text.yview(*args)
-        self.left_line_numbers.yview(*args)
-        self.right_line_numbers.yview(*args)
+        self.request_scroll("y", self.ruler_side, *args)
 
     def sync_xscroll(self, *args):
-        self.left_text.xview(*args)
-        self.right_text.xview(*args)
-        self.hscrollbar.set(*self.left_text.xview())
+        self.request_scroll("x", 0, *args)
 
     def on_mousewheel(self, event):
         if event.num == 4:
@@ -486,16 +1508,12 @@ class FolderCompareApp:
         else:
             delta = -1 if event.delta > 0 else 1
 
-        self.left_text.yview_scroll(delta, "units")
-        self.right_text.yview_scroll(delta, "units")
-        self.left_line_numbers.yview_scroll(delta, "units")
-        self.right_line_numbers.yview_scroll(delta, "units")
+        self.request_scroll("y", 0 if event.widget is self.left_text else 1, "scroll", delta, "units")
         return "break"
 
     def on_shift_mousewheel(self, event):
         delta = -1 if event.delta > 0 else 1
-        self.left_text.xview_scroll(delta, "units")
-        self.right_text.xview_scroll(delta, "units")
+        self.request_scroll("x", 0, "scroll", delta, "units")
         return "break"
 
     def on_mouse_click_status(self, event):
@@ -503,11 +1521,36 @@ class FolderCompareApp:
             os.system('gvim -d '+self.left_file+' '+self.right_file)
 
     def on_click_line(self, event):
-        pass  # No special behavior for clicking lines
+        # Remembers the clicked file line; Next/Prev Diff continue from there
+        side = 0 if event.widget is self.left_text else 1
+        line = int(event.widget.index("current").split(".")[0])
+        if self.virtual_view:
+            line += self.view_top[side]
+        self.clicked_line = (side, line)
+        index = bisect.bisect_right(self.diff_starts[side], line) - 1
+        if index >= 0 and line <= self.diff_ranges[index][side][1]:
+            self.status_right.config(text=f"Line {line} clicked\n(Diff {index+1}/{len(self.diff_ranges)})")
+        else:
+            self.status_right.config(text=f"Line {line} clicked\n(No diff)")
 
 
 if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="R2D2 folder compare")
+    parser.add_argument("--diff-cache-mb", type=int, default=DIFF_CACHE_MB,
+                        help="memory budget for cached file diffs")
+    parser.add_argument("--trace", action="store_true", help="record phase timings from the start")
+    args = parser.parse_args()
+    TRACER.enabled = args.trace
     root = tk.Tk()
-    app = FolderCompareApp(root)
+    app = FolderCompareApp(root, args.diff_cache_mb)
     root.mainloop()
+    app.cancel_scan()
+    app.executor.shutdown()
+    app.stop_stream()
+    if app.diff_executor is not None:
+        app.diff_executor.shutdown(cancel_futures=True)
+    if app.watcher is not None:
+        app.watcher.close()
+    if app.digest_cache is not None:
+        app.digest_cache.close()
 
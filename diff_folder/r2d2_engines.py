@@ -0,0 +1,451 @@
+#!/usr/bin/env python3
+
+# Line diff engines. Every engine returns the same difflib style opcode list
+# [(tag, i1, i2, j1, j2), ...] so rendering and diff_ranges don't care which
+# one produced it. No tkinter in here.
+
+import difflib
+import re
+from array import array
+from heapq import heappop, heappush
+from itertools import chain, count
+
+HISTOGRAM_MAX_CHAIN = 64
+INLINE_TOKEN = re.compile(r"\w+|\s+|[^\w\s]")
+INLINE_MAX_TOKENS = 5000  # past this the changed middle is marked as one span
+
+
+# -------- Shared driver --------
+def iter_block_opcodes(blocks, n, m):
+    # Same conversion as SequenceMatcher.get_opcodes, from (i, j, size) blocks
+    # arriving in order.
+    i = j = 0
+    for ai, bj, size in chain(blocks, [(n, m, 0)]):
+        if i < ai and j < bj:
+            yield ("replace", i, ai, j, bj)
+        elif i < ai:
+            yield ("delete", i, ai, j, j)
+        elif j < bj:
+            yield ("insert", i, i, j, bj)
+        if size:
+            yield ("equal", ai, ai + size, bj, bj + size)
+        i, j = ai + size, bj + size
+
+
+def blocks_to_opcodes(blocks, n, m):
+    return list(iter_block_opcodes(blocks, n, m))
+
+
+def iter_merged(blocks):
+    # Join blocks that continue each other; input and output are in order.
+    last = None
+    for block in blocks:
+        if last and last[0] + last[2] == block[0] and last[1] + last[2] == block[1]:
+            last = (last[0], last[1], last[2] + block[2])
+            continue
+        if last:
+            yield last
+        last = block
+    if last:
+        yield last
+
+
+def iter_blocks(a, b, split=None):
+    # Trim common prefix/suffix of each region, then let split() propose anchor
+    # blocks to recurse between; regions it cannot split go to the Myers bisect.
+    # Regions are worked leftmost first, so a block that lies before the region
+    # being worked on is final and is handed out right away.
+    pending = []
+    stack = [(0, len(a), 0, len(b))]
+    while stack:
+        alo, ahi, blo, bhi = stack.pop()
+        while pending and pending[0][0] < alo:
+            yield heappop(pending)
+        p = 0
+        while alo + p < ahi and blo + p < bhi and a[alo + p] == b[blo + p]:
+            p += 1
+        if p:
+            heappush(pending, (alo, blo, p))
+            alo += p
+            blo += p
+        s = 0
+        while ahi - s > alo and bhi - s > blo and a[ahi - 1 - s] == b[bhi - 1 - s]:
+            s += 1
+        if s:
+            heappush(pending, (ahi - s, bhi - s, s))
+            ahi -= s
+            bhi -= s
+        if alo == ahi or blo == bhi:
+            continue
+
+        anchors = split(a, alo, ahi, b, blo, bhi) if split else None
+        if anchors:
+            regions = []
+            i, j = alo, blo
+            for ai, bj, size in anchors:
+                regions.append((i, ai, j, bj))
+                heappush(pending, (ai, bj, size))
+                i, j = ai + size, bj + size
+            regions.append((i, ahi, j, bhi))
+            stack.extend(reversed(regions))
+            continue
+
+        middle = myers_bisect(a, alo, ahi, b, blo, bhi)
+        if middle is None:
+            continue
+        x, y = middle
+        stack.append((x, ahi, y, bhi))
+        stack.append((alo, x, blo, y))
+    while pending:
+        yield heappop(pending)
+
+
+def matching_blocks(a, b, split=None):
+    return list(iter_merged(iter_blocks(a, b, split)))
+
+
+# -------- Myers O(ND), linear space --------
+def myers_bisect(a, alo, ahi, b, blo, bhi):
+    # Find the middle snake of a[alo:ahi] vs b[blo:bhi] by running the forward
+    # and reverse searches until they overlap. Only two V arrays of size
+    # O(N + M) are kept. Returns the split point, or None if nothing matches.
+    n = ahi - alo
+    m = bhi - blo
+    max_d = (n + m + 1) // 2
+    v_offset = max_d
+    v_length = 2 * max_d + 2
+    v1 = [-1] * v_length
+    v2 = [-1] * v_length
+    v1[v_offset + 1] = 0
+    v2[v_offset + 1] = 0
+    delta = n - m
+    front = delta % 2 != 0
+    k1start = k1end = k2start = k2end = 0
+    for d in range(max_d):
+        for k1 in range(-d + k1start, d + 1 - k1end, 2):
+            k1_offset = v_offset + k1
+            if k1 == -d or (k1 != d and v1[k1_offset - 1] < v1[k1_offset + 1]):
+                x1 = v1[k1_offset + 1]
+            else:
+                x1 = v1[k1_offset - 1] + 1
+            y1 = x1 - k1
+            while x1 < n and y1 < m and a[alo + x1] == b[blo + y1]:
+                x1 += 1
+                y1 += 1
+            v1[k1_offset] = x1
+            if x1 > n:
+                k1end += 2
+            elif y1 > m:
+                k1start += 2
+            elif front:
+                k2_offset = v_offset + delta - k1
+                if 0 <= k2_offset < v_length and v2[k2_offset] != -1:
+                    if x1 >= n - v2[k2_offset]:
+                        return alo + x1, blo + y1
+        for k2 in range(-d + k2start, d + 1 - k2end, 2):
+            k2_offset = v_offset + k2
+            if k2 == -d or (k2 != d and v2[k2_offset - 1] < v2[k2_offset + 1]):
+                x2 = v2[k2_offset + 1]
+            else:
+                x2 = v2[k2_offset - 1] + 1
+            y2 = x2 - k2
+            while x2 < n and y2 < m and a[ahi - x2 - 1] == b[bhi - y2 - 1]:
+                x2 += 1
+                y2 += 1
+            v2[k2_offset] = x2
+            if x2 > n:
+                k2end += 2
+            elif y2 > m:
+                k2start += 2
+            elif not front:
+                k1_offset = v_offset + delta - k2
+                if 0 <= k1_offset < v_length and v1[k1_offset] != -1:
+                    x1 = v1[k1_offset]
+                    y1 = v_offset + x1 - k1_offset
+                    if x1 >= n - x2:
+                        return alo + x1, blo + y1
+    return None
+
+
+# -------- Patience --------
+def patience_split(a, alo, ahi, b, blo, bhi):
+    # Anchor on lines that occur exactly once on both sides, keeping the
+    # longest increasing subsequence of their positions.
+    counts = {}
+    for i in range(alo, ahi):
+        entry = counts.get(a[i])
+        counts[a[i]] = [1, i, -1] if entry is None else [entry[0] + 1, i, -1]
+    for j in range(blo, bhi):
+        entry = counts.get(b[j])
+        if entry is not None and entry[0] == 1:
+            entry[2] = j if entry[2] == -1 else -2
+    pairs = sorted((i, j) for count, i, j in counts.values() if count == 1 and j >= 0)
+    if not pairs:
+        return None
+
+    # Patience sorting on the b positions
+    tails = []
+    tail_index = []
+    back = [-1] * len(pairs)
+    for k, (i, j) in enumerate(pairs):
+        lo, hi = 0, len(tails)
+        while lo < hi:
+            mid = (lo + hi) // 2
+            if tails[mid] < j:
+                lo = mid + 1
+            else:
+                hi = mid
+        if lo:
+            back[k] = tail_index[lo - 1]
+        if lo == len(tails):
+            tails.append(j)
+            tail_index.append(k)
+        else:
+            tails[lo] = j
+            tail_index[lo] = k
+    anchors = []
+    k = tail_index[-1]
+    while k != -1:
+        anchors.append((pairs[k][0], pairs[k][1], 1))
+        k = back[k]
+    anchors.reverse()
+    return anchors
+
+
+# -------- Histogram --------
+def histogram_split(a, alo, ahi, b, blo, bhi):
+    # git-style histogram: seed on the rarest line of a that also appears in b,
+    # grow it into the longest common run, prefer low occurrence counts.
+    occurrences = {}
+    for i in range(alo, ahi):
+        occurrences.setdefault(a[i], []).append(i)
+    best = None
+    best_count = HISTOGRAM_MAX_CHAIN + 1
+    best_size = 0
+    j = blo
+    while j < bhi:
+        positions = occurrences.get(b[j])
+        next_j = j + 1
+        if positions is not None and len(positions) <= best_count:
+            for i in positions:
+                si, sj = i, j
+                while si > alo and sj > blo and a[si - 1] == b[sj - 1]:
+                    si -= 1
+                    sj -= 1
+                ei, ej = i + 1, j + 1
+                while ei < ahi and ej < bhi and a[ei] == b[ej]:
+                    ei += 1
+                    ej += 1
+                size = ei - si
+                if len(positions) < best_count or size > best_size:
+                    best = (si, sj, size)
+                    best_count = len(positions)
+                    best_size = size
+                next_j = max(next_j, ej)
+        j = next_j
+    return [best] if best else None
+
+
+# -------- Line interning --------
+def intern_lines(a, b):
+    # Map every distinct line of both sides to a small int so the engines compare
+    # ints instead of strings. Indices are unchanged, so opcodes computed on the
+    # id arrays apply directly to the original line lists.
+    ids = {}
+    a_ids = array("i", map(ids.setdefault, a, count()))
+    b_ids = array("i", map(ids.setdefault, b, count(len(a_ids))))
+    return a_ids, b_ids
+
+
+# -------- Engines --------
+def difflib_opcodes(a, b):
+    return difflib.SequenceMatcher(None, a, b).get_opcodes()
+
+
+def myers_opcodes(a, b):
+    return blocks_to_opcodes(matching_blocks(a, b), len(a), len(b))
+
+
+def patience_opcodes(a, b):
+    return blocks_to_opcodes(matching_blocks(a, b, patience_split), len(a), len(b))
+
+
+def histogram_opcodes(a, b):
+    return blocks_to_opcodes(matching_blocks(a, b, histogram_split), len(a), len(b))
+
+
+def iter_positional(a, b):
+    # No alignment at all: line i is compared with line i, like the simple
+    # r2d2.py view. Runs of equal or differing rows become one opcode each.
+    n, m = len(a), len(b)
+    start = 0
+    same = None
+    for i in range(min(n, m)):
+        equal = a[i] == b[i]
+        if equal != same and i > start:
+            yield ("equal" if same else "replace", start, i, start, i)
+            start = i
+        same = equal
+    common = min(n, m)
+    if common > start:
+        yield ("equal" if same else "replace", start, common, start, common)
+    if n > common:
+        yield ("delete", common, n, m, m)
+    elif m > common:
+        yield ("insert", n, n, common, m)
+
+
+def positional_opcodes(a, b):
+    return list(iter_positional(a, b))
+
+
+ENGINES = {
+    "difflib": difflib_opcodes,
+    "myers": myers_opcodes,
+    "patience": patience_opcodes,
+    "histogram": histogram_opcodes,
+    "positional": positional_opcodes,
+}
+# Engines that settle opcodes left to right and can stream them; the others
+# only yield once the whole diff is done.
+SPLITTERS = {
+    "myers": None,
+    "patience": patience_split,
+    "histogram": histogram_split,
+}
+DEFAULT_ENGINE = "difflib"
+# Engines that run faster on interned ids. The pure Python engines mostly hit
+# C-level string compares already and lose more to the interning pass.
+INTERNED_ENGINES = {"difflib"}
+
+
+def get_opcodes(a, b, engine=DEFAULT_ENGINE, interned=None):
+    if interned is None:
+        interned = engine in INTERNED_ENGINES
+    if interned:
+        a, b = intern_lines(a, b)
+    return ENGINES[engine](a, b)
+
+
+def iter_opcodes(a, b, engine=DEFAULT_ENGINE, interned=None):
+    # get_opcodes as a generator, so a front-end can render the first hunks
+    # while the rest of the file is still being diffed.
+    if interned is None:
+        interned = engine in INTERNED_ENGINES
+    if interned:
+        a, b = intern_lines(a, b)
+    if engine in SPLITTERS:
+        yield from iter_block_opcodes(iter_merged(iter_blocks(a, b, SPLITTERS[engine])), len(a), len(b))
+    elif engine == "positional":
+        yield from iter_positional(a, b)
+    else:
+        yield from ENGINES[engine](a, b)
+
+
+# -------- Intra-line diff --------
+def is_word_char(c):
+    return c.isalnum() or c == "_"
+
+
+def inline_spans(a, b):
+    # Character spans (start, end) that differ between two versions of a line.
+    # The common prefix and suffix are cut off first, the middle is matched
+    # word by word so a renamed identifier lights up as a whole.
+    a = a.rstrip("\r\n")
+    b = b.rstrip("\r\n")
+    limit = min(len(a), len(b))
+    p = 0
+    while p < limit and a[p] == b[p]:
+        p += 1
+    s = 0
+    while s < limit - p and a[-1 - s] == b[-1 - s]:
+        s += 1
+    # Don't cut through a word: back the cuts up to token boundaries
+    while p and is_word_char(a[p - 1]) and (is_word_char(a[p:p + 1]) or is_word_char(b[p:p + 1])):
+        p -= 1
+    while s and is_word_char(a[len(a) - s]) and (is_word_char(a[len(a) - s - 1:len(a) - s])
+                                                 or is_word_char(b[len(b) - s - 1:len(b) - s])):
+        s -= 1
+    a_mid = a[p:len(a) - s]
+    b_mid = b[p:len(b) - s]
+    a_tokens = INLINE_TOKEN.findall(a_mid)
+    b_tokens = INLINE_TOKEN.findall(b_mid)
+    if not a_tokens or not b_tokens or len(a_tokens) + len(b_tokens) > INLINE_MAX_TOKENS:
+        return ([(p, len(a) - s)] if a_mid else []), ([(p, len(b) - s)] if b_mid else [])
+
+    a_starts = [p]
+    for token in a_tokens:
+        a_starts.append(a_starts[-1] + len(token))
+    b_starts = [p]
+    for token in b_tokens:
+        b_starts.append(b_starts[-1] + len(token))
+    a_spans, b_spans = [], []
+    matcher = difflib.SequenceMatcher(None, a_tokens, b_tokens, autojunk=False)
+    for tag, i1, i2, j1, j2 in matcher.get_opcodes():
+        if tag == "equal":
+            continue
+        if i1 < i2:
+            a_spans.append((a_starts[i1], a_starts[i2]))
+        if j1 < j2:
+            b_spans.append((b_starts[j1], b_starts[j2]))
+    return a_spans, b_spans
+
+
+# -------- Unified diff --------
+def format_range(start, stop):
+    # "start,length" the way unified diff headers spell it
+    beginning = start + 1
+    length = stop - start
+    if length == 1:
+        return f"{beginning}"
+    if not length:
+        beginning -= 1
+    return f"{beginning},{length}"
+
+
+def group_opcodes(opcodes, context=3):
+    # Same grouping as SequenceMatcher.get_grouped_opcodes, for any engine.
+    opcodes = list(opcodes)
+    if not opcodes:
+        opcodes = [("equal", 0, 1, 0, 1)]
+    if opcodes[0][0] == "equal":
+        tag, i1, i2, j1, j2 = opcodes[0]
+        opcodes[0] = tag, max(i1, i2 - context), i2, max(j1, j2 - context), j2
+    if opcodes[-1][0] == "equal":
+        tag, i1, i2, j1, j2 = opcodes[-1]
+        opcodes[-1] = tag, i1, min(i2, i1 + context), j1, min(j2, j1 + context)
+    group = []
+    for tag, i1, i2, j1, j2 in opcodes:
+        if tag == "equal" and i2 - i1 > 2 * context:
+            group.append((tag, i1, min(i2, i1 + context), j1, min(j2, j1 + context)))
+            yield group
+            group = []
+            i1, j1 = max(i1, i2 - context), max(j1, j2 - context)
+        group.append((tag, i1, i2, j1, j2))
+    if group and not (len(group) == 1 and group[0][0] == "equal"):
+        yield group
+
+
+def unified_diff(a, b, opcodes, fromfile="", tofile="", context=3):
+    # difflib.unified_diff output, driven by precomputed opcodes.
+    started = False
+    for group in group_opcodes(opcodes, context):
+        if not started:
+            started = True
+            yield f"--- {fromfile}\n"
+            yield f"+++ {tofile}\n"
+        first, last = group[0], group[-1]
+        file1_range = format_range(first[1], last[2])
+        file2_range = format_range(first[3], last[4])
+        yield f"@@ -{file1_range} +{file2_range} @@\n"
+        for tag, i1, i2, j1, j2 in group:
+            if tag == "equal":
+                for line in a[i1:i2]:
+                    yield " " + line
+                continue
+            if tag in ("replace", "delete"):
+                for line in a[i1:i2]:
+                    yield "-" + line
+            if tag in ("replace", "insert"):
+                for line in b[j1:j2]:
+                    yield "+" + line
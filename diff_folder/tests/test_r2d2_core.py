@@ -0,0 +1,271 @@
+import io
+import os
+import random
+import sqlite3
+import subprocess
+import sys
+import tarfile
+import time
+import tracemalloc
+import zipfile
+
+import pytest
+
+import r2d2_core
+from r2d2_core import (DIFFERENT, IDENTICAL, LEFT_ONLY, RIGHT_ONLY, RULER_COLORS, UNCHECKED, ChunkedFile,
+                       DiffDensity, DigestCache, FolderComparison, MappedFile, diff_files, file_digest, iter_hunks, open_pair, reopen)
+
+
+def make_tree(root, files):
+    for name, data in files.items():
+        path = root / name
+        path.parent.mkdir(parents=True, exist_ok=True)
+        path.write_bytes(data)
+    return str(root)
+
+
+@pytest.fixture
+def folders(tmp_path):
+    left = make_tree(tmp_path / "left", {"same.txt": b"a\n", "changed.txt": b"a\n", "left.txt": b"l\n",
+                                         ".hidden": b"h\n", "sub/inner.txt": b"i\n", "gone/x.txt": b"x\n"})
+    right = make_tree(tmp_path / "right", {"same.txt": b"a\n", "changed.txt": b"b\n", "right.txt": b"r\n",
+                                           "sub/inner.txt": b"i\n", "new/y.txt": b"y\n"})
+    return left, right
+
+
+def test_pair_flat(folders):
+    comparison = FolderComparison(*folders).pair()
+    assert comparison.rows == [["changed.txt", UNCHECKED], ["left.txt", LEFT_ONLY], ["right.txt", RIGHT_ONLY],
+                               ["same.txt", UNCHECKED]]
+    assert comparison.names("left") == ["changed.txt", "left.txt", "same.txt"]
+    assert comparison.names("right") == ["changed.txt", "right.txt", "same.txt"]
+
+
+def test_pair_recursive(folders):
+    rows = dict(FolderComparison(*folders, recursive=True).pair().rows)
+    assert rows[os.path.join("gone", "x.txt")] == LEFT_ONLY
+    assert rows[os.path.join("new", "y.txt")] == RIGHT_ONLY
+    assert rows[os.path.join("sub", "inner.txt")] == UNCHECKED
+    assert ".hidden" not in rows
+
+
+def test_check_all_statuses(folders):
+    comparison = FolderComparison(*folders, recursive=True).pair().check_all()
+    rows = dict(comparison.rows)
+    assert rows["same.txt"] == IDENTICAL
+    assert rows["changed.txt"] == DIFFERENT
+    assert rows[os.path.join("sub", "inner.txt")] == IDENTICAL
+    assert comparison.unchecked() == []
+    counts = comparison.counts()
+    assert (counts[IDENTICAL], counts[DIFFERENT], counts[LEFT_ONLY], counts[RIGHT_ONLY]) == (2, 1, 2, 2)
+    assert comparison.summary() == "Identical: 2  Different: 1  Left only: 2  Right only: 2"
+
+
+def test_one_side_only(folders):
+    comparison = FolderComparison(folders[0], "").pair()
+    assert all(status == LEFT_ONLY for name, status in comparison.rows)
+    assert comparison.unchecked() == []
+
+
+def write_log(path, count, seed, edits=0):
+    rng = random.Random(seed)
+    lines = [b"2026-10-18 %08d INFO worker=%d value=%f\n" % (i, i % 17, rng.random()) for i in range(count)]
+    for k in range(edits):
+        at = rng.randrange(len(lines))
+        lines[at:at + 3] = [b"edited %d\n" % k] * rng.randint(1, 5)
+    path.write_bytes(b"".join(lines))
+
+
+@pytest.fixture
+def chunked(monkeypatch):
+    # Chunk everything, with chunks small enough for test-sized files
+    monkeypatch.setattr(r2d2_core, "CHUNKED_BYTES", 0)
+    monkeypatch.setattr(r2d2_core, "CDC_MIN_AVG", 4096)
+    monkeypatch.setattr(r2d2_core, "INDEX_CHUNK", 256 * 1024)
+    monkeypatch.setattr(r2d2_core, "CHUNK_SIZE", 64 * 1024)
+
+
+def rebuilt(left, right, opcodes):
+    # Right side rebuilt from the opcodes; checks they tile both files
+    out = []
+    i = j = 0
+    for tag, i1, i2, j1, j2 in opcodes:
+        assert (i1, j1) == (i, j)
+        if tag == "equal":
+            assert left[i1:i2] == right[j1:j2]
+        out += right[j1:j2]
+        i, j = i2, j2
+    assert (i, j) == (len(left), len(right))
+    return out
+
+
+def test_anchored_matches_line_diff(tmp_path, chunked):
+    write_log(tmp_path / "a", 50000, 1)
+    write_log(tmp_path / "b", 50000, 1, edits=20)
+    left, right, opcodes = diff_files(str(tmp_path / "a"), str(tmp_path / "b"))
+    assert isinstance(left, ChunkedFile) and len(left.digests) > 100
+    assert rebuilt(left, right, opcodes) == list(right)
+    full = list(iter_hunks(MappedFile(str(tmp_path / "a")), MappedFile(str(tmp_path / "b"))))
+    assert opcodes == full
+
+
+def test_chunked_edges(tmp_path, chunked):
+    body = b"".join(b"row %d\n" % i for i in range(3000))
+    for a, b in [(b"", b""), (b"", b"x\n"), (b"x", b"x\n"), (body, body.replace(b"\n", b"\r\n")),
+                 (b"a" * 20000 + b"\n" + body, body)]:
+        (tmp_path / "a").write_bytes(a)
+        (tmp_path / "b").write_bytes(b)
+        left, right, opcodes = diff_files(str(tmp_path / "a"), str(tmp_path / "b"))
+        assert len(left) == len(MappedFile(str(tmp_path / "a")))
+        assert rebuilt(left, right, opcodes) == list(right)
+
+
+def test_reopen_chunk_table(tmp_path, chunked):
+    write_log(tmp_path / "a", 20000, 2)
+    left, right = open_pair(str(tmp_path / "a"), str(tmp_path / "a"))
+    again = reopen(str(tmp_path / "a"), left.line_index)
+    assert isinstance(again, ChunkedFile)
+    assert list(again) == list(MappedFile(str(tmp_path / "a")))
+
+
+def test_cut_points_stable_across_processes(tmp_path, chunked):
+    # Cuts must not depend on the per-process hash seed
+    write_log(tmp_path / "a", 20000, 3)
+    script = ("import sys, r2d2_core as c; c.CDC_MIN_AVG = 4096; c.INDEX_CHUNK = 256 * 1024; "
+              "size = c.source_stat(sys.argv[1]).st_size; "
+              "f = c.ChunkedFile(sys.argv[1], params=c.chunk_params(size, open(sys.argv[1], 'rb').read(1 << 20))); "
+              "print(list(f.chunks[1]))")
+    runs = {subprocess.run([sys.executable, "-c", script, str(tmp_path / "a")], capture_output=True, check=True,
+                           cwd=r2d2_core.__file__.rsplit("/", 1)[0], env={"PYTHONHASHSEED": seed}).stdout
+            for seed in ("1", "2")}
+    assert len(runs) == 1
+
+
+def peak_diff(tmp_path, count):
+    write_log(tmp_path / "a", count, 4)
+    write_log(tmp_path / "b", count, 4, edits=5)
+    tracemalloc.start()
+    try:
+        left, right, opcodes = diff_files(str(tmp_path / "a"), str(tmp_path / "b"))
+        return tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+        left.close()
+        right.close()
+
+
+def test_anchored_memory_flat(tmp_path, chunked, monkeypatch):
+    # Four times the file, about the same peak: the chunk table is capped,
+    # equal runs are compared in windows and nothing is held per line
+    monkeypatch.setattr(r2d2_core, "CDC_MAX_CHUNKS", 512)
+    small = peak_diff(tmp_path, 100000)
+    large = peak_diff(tmp_path, 400000)
+    assert large < small * 1.2
+
+
+def test_density_bars_and_nearest():
+    # Runs of equal shade become one bar; a click goes to the closest diff start
+    density = DiffDensity(1000)
+    density.add(0, 100)
+    density.add(500, 510)
+    assert density.bars(10) == [(0, 1, RULER_COLORS[-1]), (5, 6, RULER_COLORS[0])]
+    starts = [1, 501, 901]
+    assert [density.nearest(starts, f) for f in (0.0, 0.2, 0.3, 0.5, 0.8, 1.0)] == [0, 0, 1, 1, 2, 2]
+    assert DiffDensity(10).bars(5) == []
+
+
+def test_digest_cache_two_instances(tmp_path, monkeypatch):
+    # Another instance holding the write lock costs at most the busy timeout,
+    # never loses rows and never blocks lookups
+    monkeypatch.setattr(r2d2_core, "CACHE_BATCH", 1)
+    monkeypatch.setattr(r2d2_core, "CACHE_BUSY_SECONDS", 0.2)
+    db = str(tmp_path / "cache.db")
+    files = []
+    for k in range(4):
+        files.append(tmp_path / f"f{k}")
+        files[-1].write_bytes(b"data %d\n" % k)
+    first, second = DigestCache(db), DigestCache(db)
+    other = sqlite3.connect(db)
+    other.execute("BEGIN IMMEDIATE")
+    started = time.monotonic()
+    assert first.digest(str(files[0])) == file_digest(str(files[0]))
+    assert second.digest(str(files[1])) == file_digest(str(files[1]))
+    assert time.monotonic() - started < 2
+    assert first.pending and second.pending
+    other.rollback()
+    first.close()
+    second.close()
+    third = DigestCache(db)
+    for path in files[:2]:
+        assert third.digest(str(path)) == file_digest(str(path))
+    assert third.hits == 2
+    third.close()
+
+
+def test_pin_sources_reads_the_pinned_tree(tmp_path):
+    # A worker's cached revision index follows the tree the front-end sends
+    repo = str(tmp_path)
+    git = ["git", "-C", repo, "-c", "user.name=t", "-c", "user.email=t@t"]
+    subprocess.run(git + ["init", "-q"], check=True)
+    (tmp_path / "a.txt").write_text("one\n")
+    subprocess.run(git + ["add", "a.txt"], check=True)
+    subprocess.run(git + ["commit", "-qm", "one"], check=True)
+    member = repo + "@HEAD/a.txt"
+    assert r2d2_core.open_source(member).read() == b"one\n"
+    (tmp_path / "a.txt").write_text("two\n")
+    subprocess.run(git + ["commit", "-qam", "two"], check=True)
+    assert r2d2_core.open_source(member).read() == b"one\n"  # cached until refreshed
+    r2d2_core.pin_sources({repo + "@HEAD": r2d2_core.resolve_tree(repo + "@HEAD")})
+    assert r2d2_core.open_source(member).read() == b"two\n"
+    assert r2d2_core.compare_job(repo + "@HEAD~1/a.txt", member)[0] == "text"
+
+
+@pytest.mark.parametrize("threshold", [None, 0])
+def test_reopen_stale_index(tmp_path, monkeypatch, threshold):
+    # A file that changed after the worker indexed it is refused, not
+    # re-indexed under opcodes that no longer fit it
+    if threshold is not None:
+        monkeypatch.setattr(r2d2_core, "CHUNKED_BYTES", threshold)
+        monkeypatch.setattr(r2d2_core, "CDC_MIN_AVG", 4096)
+    write_log(tmp_path / "a", 5000, 6)
+    write_log(tmp_path / "b", 5000, 6, edits=3)
+    opcodes, left_index, right_index = r2d2_core.diff_job(str(tmp_path / "a"), str(tmp_path / "b"))
+    with open(tmp_path / "b", "ab") as f:
+        f.write(b"one more line\n")
+    with pytest.raises(r2d2_core.StaleIndexError):
+        r2d2_core.reopen_pair(str(tmp_path / "a"), str(tmp_path / "b"), left_index, right_index)
+    left, right = r2d2_core.reopen_pair(str(tmp_path / "a"), str(tmp_path / "a"), left_index, left_index)
+    assert len(left) == 5000
+
+
+ARCHIVE_FILES = {"same.txt": b"a\nb\n", "changed.txt": b"a\nb\n", "crlf.txt": b"a\nb\n", "sub/inner.txt": b"i\n"}
+FOLDER_FILES = {"same.txt": b"a\nb\n", "changed.txt": b"a\nc\n", "crlf.txt": b"a\r\nb\r\n", "sub/inner.txt": b"i\n"}
+
+
+def make_archive(path, files):
+    if str(path).endswith(".zip"):
+        with zipfile.ZipFile(path, "w") as archive:
+            for name, data in files.items():
+                archive.writestr(name, data)
+    else:
+        with tarfile.open(path, "w:gz") as archive:
+            for name, data in files.items():
+                info = tarfile.TarInfo(name)
+                info.size = len(data)
+                archive.addfile(info, io.BytesIO(data))
+    return str(path)
+
+
+@pytest.mark.parametrize("suffix, crlf_status", [(".zip", IDENTICAL), (".tgz", DIFFERENT)])
+def test_archive_against_folder(tmp_path, monkeypatch, suffix, crlf_status):
+    archive = make_archive(tmp_path / f"release{suffix}", ARCHIVE_FILES)
+    folder = make_tree(tmp_path / "folder", FOLDER_FILES)
+    opened = []
+    real_open = r2d2_core.ArchiveIndex.open
+    monkeypatch.setattr(r2d2_core.ArchiveIndex, "open", lambda self, name: opened.append(name) or real_open(self, name))
+    rows = dict(FolderComparison(archive, folder, recursive=True).pair().check_all().rows)
+    assert rows == {"changed.txt": DIFFERENT, "crlf.txt": crlf_status, "same.txt": IDENTICAL,
+                    os.path.join("sub", "inner.txt"): IDENTICAL}
+    # A compressed tar is compared by CRC only; its members are never read
+    assert opened if suffix == ".zip" else not opened
+    assert r2d2_core.open_source(os.path.join(archive, "sub", "inner.txt")).read() == b"i\n"
@@ -0,0 +1,59 @@
+import random
+
+import pytest
+
+from r2d2_engines import ENGINES, get_opcodes, iter_opcodes
+
+rng = random.Random(5)
+words = [f"line {rng.randrange(40)}\n" for _ in range(400)]
+edited = list(words)
+for _ in range(30):
+    at = rng.randrange(len(edited))
+    edited[at:at + rng.randrange(4)] = [f"new {rng.randrange(40)}\n"] * rng.randrange(4)
+
+CASES = [
+    ([], []),
+    ([], ["a\n"]),
+    (["a\n"], []),
+    (["a\n", "b\n", "c\n"], ["a\n", "b\n", "c\n"]),
+    (["a\n", "b\n", "c\n"], ["a\n", "x\n", "c\n", "d\n"]),
+    (["x\n"] * 5, ["x\n"] * 3 + ["y\n"] + ["x\n"] * 4),
+    (words, edited),
+    (edited, words),
+]
+
+
+def rebuilt(a, b, opcodes):
+    # Right side rebuilt from the left and the opcodes; they must tile both
+    out = []
+    i = j = 0
+    for tag, i1, i2, j1, j2 in opcodes:
+        assert (i1, j1) == (i, j)
+        assert tag in ("equal", "replace", "delete", "insert")
+        if tag == "equal":
+            assert a[i1:i2] == b[j1:j2]
+            out += a[i1:i2]
+        else:
+            assert i1 < i2 or j1 < j2
+            out += b[j1:j2]
+        i, j = i2, j2
+    assert (i, j) == (len(a), len(b))
+    return out
+
+
+@pytest.mark.parametrize("engine", sorted(ENGINES))
+@pytest.mark.parametrize("a, b", CASES)
+def test_engine_rebuilds_right_side(engine, a, b):
+    assert rebuilt(a, b, list(get_opcodes(a, b, engine))) == b
+
+
+@pytest.mark.parametrize("engine", sorted(ENGINES))
+def test_iter_opcodes_matches_get_opcodes(engine):
+    assert list(iter_opcodes(words, edited, engine)) == list(get_opcodes(words, edited, engine))
+
+
+@pytest.mark.parametrize("engine", sorted(set(ENGINES) - {"positional"}))
+def test_engine_finds_common_lines(engine):
+    a = ["a\n", "b\n", "c\n", "d\n"]
+    b = ["x\n", "a\n", "b\n", "c\n", "d\n"]
+    assert list(get_opcodes(a, b, engine)) == [("insert", 0, 0, 0, 1), ("equal", 0, 4, 1, 5)]